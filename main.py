@@ -21,10 +21,18 @@ import time
 import tempfile
 import threading
 import json
+import itertools
+import hashlib
+import collections
+import gzip
+import struct
+import zipfile
+import abc
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import Qt, pyqtSignal, QThread, QTimer, QTime, QObject
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QPushButton, 
                             QVBoxLayout, QHBoxLayout, QProgressBar, QMessageBox, QFileDialog, 
-                            QGroupBox, QFormLayout, QLineEdit)
+                            QGroupBox, QFormLayout, QLineEdit, QCheckBox, QComboBox, QInputDialog)
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QFont, QIntValidator, QIcon
 
 import traceback
@@ -45,6 +53,8 @@ sys.excepthook = handle_exception
 
 
 # 工作区管理器
+# 所有路径都相对于工作区自身的current_path解析，不会调用os.chdir修改进程的工作目录，
+# 因此多个工作区可以在不同线程中同时使用
 class Workspace:
     def __init__(self, root_path=None, xlog=lambda *args, **kwargs: None):
         if root_path is None:
@@ -54,7 +64,6 @@ class Workspace:
         self.root_path = os.path.abspath(root_path)
         if not os.path.exists(self.root_path):
             os.makedirs(self.root_path, exist_ok=True)
-        os.chdir(self.root_path)
         self.current_path = self.root_path
         self.previous_path = self.root_path
         self.xlog = xlog or self._default_logger
@@ -73,6 +82,10 @@ class Workspace:
         color_code = f"\033[38;2;{r};{g};{b}m"
         print(f"{color_code}[{level_names[level]}] {content}\033[0m")
 
+    def resolve(self, path):
+        """将路径解析为绝对路径（相对路径基于当前工作区目录，而非进程工作目录）"""
+        return os.path.normpath(os.path.join(self.current_path, path))
+
     def is_valid_folder_name(self, name):
         """
         检查文件夹名称是否符合系统命名规则
@@ -129,13 +142,13 @@ class Workspace:
         if not file_path:
             file_path = self.current_path
             
-        if os.path.isdir(file_path):
-            return "文件夹"
-            
         # 处理相对路径
         if not os.path.isabs(file_path):
             file_path = os.path.join(self.current_path, file_path)
         
+        if os.path.isdir(file_path):
+            return "文件夹"
+        
         # 检查文件是否存在
         if not os.path.exists(file_path):
             return "文件不存在"
@@ -224,7 +237,7 @@ class Workspace:
     
     def is_safe_path(self, target_path):
         """检查目标路径是否在根目录内（防止越界）"""
-        target_abs = os.path.abspath(target_path)
+        target_abs = self.resolve(target_path)
         return os.path.commonpath([self.root_path]) == os.path.commonpath([self.root_path, target_abs])
     
     def cd(self, path):
@@ -247,7 +260,7 @@ class Workspace:
             new_path = os.path.join(self.current_path, path)
         
         # 规范化路径
-        new_abs_path = os.path.normpath(os.path.abspath(new_path))
+        new_abs_path = os.path.normpath(new_path)
         
         # 路径安全检查
         if not self.is_safe_path(new_abs_path):
@@ -259,8 +272,7 @@ class Workspace:
         # 创建不存在的目录
         os.makedirs(new_abs_path, exist_ok=True)
         
-        # 切换目录
-        os.chdir(new_abs_path)
+        # 切换目录（仅修改工作区状态）
         self.current_path = new_abs_path
         self.log(f"当前目录: {self.current_path}")
         
@@ -268,7 +280,6 @@ class Workspace:
     
     def return_to_root(self):
         """一键返回根目录"""
-        os.chdir(self.root_path)
         self.current_path = self.root_path
         self.previous_path = self.root_path
         self.log(f"已返回根目录: {self.current_path}")
@@ -365,6 +376,168 @@ class Workspace:
             self.log(error_msg, color=(255, 0, 0, 255), level=3)
             raise RuntimeError(error_msg) from e
     
+    def write_lines(self, file_name, lines, encoding='utf-8', chunk_size=1 << 16, skip_unchanged=False):
+        """
+        在当前目录流式创建文件，逐块写入内容（峰值内存与文件大小无关）
+        
+        参数:
+            file_name (str): 要创建的文件名称
+            lines (iterable[str | bytes]): 文件内容片段（如逐行像素生成的命令或编码器输出的字节）
+            encoding (str): 文件编码，默认为utf-8
+            chunk_size (int): 写入块大小（字符数）
+            skip_unchanged (bool): 内容哈希与已存在文件相同时保留原文件
+            
+        返回:
+            tuple: (写入的字节数, 是否实际更新了文件)
+        """
+        # 验证文件名
+        if not self.is_valid_folder_name(os.path.splitext(file_name)[0]):
+            error_msg = f"无效的文件名: {file_name}"
+            self.log(error_msg, color=(255, 0, 0, 255), level=3)
+            raise ValueError(error_msg)
+        
+        # 构建完整路径并确保安全
+        full_path = os.path.join(self.current_path, file_name)
+        if not self.is_safe_path(full_path):
+            error_msg = f"安全限制: 不能在工作区外创建文件 [{full_path}]"
+            self.log(error_msg, color=(255, 0, 0, 255), level=3)
+            raise PermissionError(error_msg)
+        
+        try:
+            if not skip_unchanged or not os.path.exists(full_path):
+                if os.path.exists(full_path):
+                    self.log(f"覆盖已存在的文件: {file_name}", 
+                            color=(255, 165, 0, 255), level=1)
+                with open(full_path, 'wb') as f:
+                    written = self.stream_to(f, lines, encoding, chunk_size)
+                self.log(f"已创建文件: {file_name} ({self._format_size(written)})", 
+                        color=(0, 255, 0, 255), level=0)
+                return written, True
+            
+            # 与原文件逐块比较，出现第一个差异时才创建临时文件，内容未变化时不产生任何写入
+            with self.DiffWriter(full_path, full_path + ".tmp") as f:
+                written = self.stream_to(f, lines, encoding, chunk_size)
+                changed = f.finish()
+            if not changed:
+                return written, False
+            os.replace(f.temp_path, full_path)
+            self.log(f"已更新文件: {file_name} ({self._format_size(written)})", 
+                    color=(0, 255, 0, 255), level=0)
+            return written, True
+        except Exception as e:
+            temp_path = full_path + ".tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            error_msg = f"创建文件失败: {file_name}, 错误: {e}"
+            self.log(error_msg, color=(255, 0, 0, 255), level=3)
+            raise RuntimeError(error_msg) from e
+    
+    @staticmethod
+    def stream_to(handle, lines, encoding='utf-8', chunk_size=1 << 16):
+        """
+        将内容片段按块编码后写入已打开的二进制句柄（文件、zip条目或DiffWriter）
+        
+        返回:
+            int: 写入的字节数
+        """
+        written = 0
+        buffer = []
+        buffered = 0
+        
+        def flush():
+            nonlocal written, buffered
+            data = b''.join(part if isinstance(part, bytes) else part.encode(encoding) for part in buffer)
+            handle.write(data)
+            written += len(data)
+            buffer.clear()
+            buffered = 0
+        
+        for line in lines:
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= chunk_size:
+                flush()
+        if buffer:
+            flush()
+        return written
+    
+    class DiffWriter:
+        """
+        与已存在文件逐块比较的写入句柄：内容一致的部分只读不写，
+        出现第一个差异时才打开临时文件，并先复制已比较一致的前缀
+        """
+        
+        def __init__(self, path, temp_path, copy_size=1 << 20):
+            self.path = path
+            self.temp_path = temp_path
+            self.copy_size = copy_size
+            self.existing = open(path, 'rb')
+            self.matched = 0
+            self.temp = None
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, *exc_info):
+            self.existing.close()
+            if self.temp is not None:
+                self.temp.close()
+            return False
+        
+        def open_temp(self):
+            """创建临时文件并写入已比较一致的前缀"""
+            self.temp = open(self.temp_path, 'wb')
+            self.existing.seek(0)
+            remaining = self.matched
+            while remaining:
+                chunk = self.existing.read(min(remaining, self.copy_size))
+                self.temp.write(chunk)
+                remaining -= len(chunk)
+        
+        def write(self, data):
+            if self.temp is None:
+                if self.existing.read(len(data)) == data:
+                    self.matched += len(data)
+                    return
+                self.open_temp()
+            self.temp.write(data)
+        
+        def finish(self):
+            """
+            结束比较
+            
+            返回:
+                bool: 内容是否与原文件不同（为True时临时文件已包含完整的新内容）
+            """
+            if self.temp is None and self.existing.read(1):
+                # 新内容是原文件的前缀，需要截短
+                self.open_temp()
+            if self.temp is not None:
+                self.temp.close()
+            return self.temp is not None
+    
+    def delete_in_background(self, name, trash_path):
+        """
+        后台删除文件夹：先重命名到trash_path（瞬间完成），再在后台线程中删除
+        
+        参数:
+            name (str): 要删除的文件夹名称
+            trash_path (str): 重命名的目标路径（需与原文件夹位于同一磁盘，且在工作区内）
+        """
+        target = os.path.join(self.current_path, name)
+        if not self.is_safe_path(target) or not self.is_safe_path(trash_path):
+            error_msg = f"安全限制: 不能删除工作区外的项目 [{target}]"
+            self.log(error_msg, color=(255, 0, 0, 255), level=3)
+            raise PermissionError(error_msg)
+        if not os.path.exists(target):
+            return None
+        
+        os.rename(target, trash_path)
+        thread = threading.Thread(target=shutil.rmtree, args=(trash_path, True), daemon=True)
+        thread.start()
+        self.log(f"已移除文件夹: {name}，正在后台删除", color=(255, 165, 0, 255), level=1)
+        return thread
+    
     def append_to_file(self, file_path, content, mode='a'):
         """
         向文件中添加内容
@@ -377,7 +550,7 @@ class Workspace:
                     'a' - 追加写入
         """
         try:
-            with open(file_path, mode, encoding='utf-8') as file:
+            with open(self.resolve(file_path), mode, encoding='utf-8') as file:
                 file.write(content)
             self.log(f"内容已成功写入文件: {file_path}")
         except IOError as e:
@@ -395,7 +568,7 @@ class Workspace:
         
         items = []
         # 添加父目录（除非在根目录）
-        if self.current_path != self.root:
+        if self.current_path != self.root_path:
             items.append(("..", "文件夹", ""))
         
         # 添加当前目录内容
@@ -588,16 +761,86 @@ class Workspace:
 
 _ws_ = Workspace(os.path.dirname(os.path.abspath(__file__)))
 
+class FFmpegProgress:
+    """
+    解析ffmpeg机器可读的进度输出（-progress pipe:1 产生的key=value行）
+
+    将out_time与探测到的时长换算为真实百分比和速度倍数，其余输出只保留最近的若干行用于报错。
+    """
+    def __init__(self, duration=None, max_log_lines=200):
+        self.duration = duration  # 秒，未知时为None
+        self.log = collections.deque(maxlen=max_log_lines)
+        self.out_time = 0.0
+        self.speed = None
+        self.finished = False
+
+    @staticmethod
+    def command_with_progress(command):
+        """在ffmpeg命令中加入进度输出参数"""
+        return [command[0], '-progress', 'pipe:1', '-nostats'] + list(command[1:])
+
+    def feed(self, line):
+        """
+        处理一行输出
+        
+        返回:
+            bool: 一个进度块是否结束（此时应刷新显示）
+        """
+        line = line.strip()
+        if not line:
+            return False
+        key, sep, value = line.partition('=')
+        if not sep or ' ' in key:
+            self.log.append(line)
+            return False
+        
+        if key in ("out_time_us", "out_time_ms"):
+            # 两者的单位实际上都是微秒
+            if value.isdigit():
+                self.out_time = int(value) / 1000000
+        elif key == "speed":
+            try:
+                self.speed = float(value.rstrip('x'))
+            except ValueError:
+                self.speed = None
+        elif key == "progress":
+            self.finished = value == "end"
+            return True
+        return False
+
+    @property
+    def percent(self):
+        """完成百分比（0-100）；时长未知时为None"""
+        if self.finished:
+            return 100.0
+        if not self.duration:
+            return None
+        return min(100.0, self.out_time / self.duration * 100)
+
+    def describe(self, name):
+        """生成进度描述文本"""
+        percent = self.percent
+        text = f"{name}中... {percent:.1f}%" if percent is not None else f"{name}中... 已处理{self.out_time:.1f}秒"
+        if self.speed:
+            text += f" (速度 {self.speed:.2f}x)"
+        return text
+
+    def tail(self, lines=10):
+        """最近的日志行"""
+        return '\n'.join(list(self.log)[-lines:])
+
+
 class FFmpegWorker(QObject):
     """单独的FFmpeg处理线程"""
     finished = pyqtSignal(bool, str)  # 成功状态，消息
     progress = pyqtSignal(int, str)  # 进度百分比，消息
     output_received = pyqtSignal(str)  # 接收输出
 
-    def __init__(self, command, output_path):
+    def __init__(self, command, output_path, duration=None):
         super().__init__()
         self.command = command
         self.output_path = output_path
+        self.parser = FFmpegProgress(duration)
         self._is_cancelled = False
         self.process = None
         
@@ -622,9 +865,9 @@ class FFmpegWorker(QObject):
             temp_dir = tempfile.mkdtemp()
             temp_file = os.path.join(temp_dir, "audio_output.ogg")
             
-            # 替换输出路径为临时文件
+            # 替换输出路径为临时文件，并启用机器可读的进度输出
             modified_cmd = []
-            for arg in self.command:
+            for arg in FFmpegProgress.command_with_progress(self.command):
                 if arg == self.output_path:
                     modified_cmd.append(temp_file)
                 else:
@@ -660,6 +903,10 @@ class FFmpegWorker(QObject):
                     if not line:
                         break
                     self.output_received.emit(line.strip())
+                    if self.parser.feed(line):
+                        percent = self.parser.percent
+                        if percent is not None:
+                            self.progress.emit(max(1, int(percent)), self.parser.describe("正在提取音频"))
             
             output_thread = threading.Thread(target=read_output)
             output_thread.daemon = True
@@ -667,6 +914,7 @@ class FFmpegWorker(QObject):
             
             # 等待进程完成
             return_code = self.process.wait()
+            output_thread.join(1)
             
             if self._is_cancelled:
                 self.progress.emit(0, "音频提取已取消")
@@ -675,7 +923,7 @@ class FFmpegWorker(QObject):
             
             if return_code != 0:
                 self.progress.emit(0, f"音频提取失败，错误码: {return_code}")
-                self.finished.emit(False, f"FFmpeg返回错误码: {return_code}")
+                self.finished.emit(False, f"FFmpeg返回错误码: {return_code}\n{self.parser.tail(5)}")
                 return
                 
             # 将临时文件移动到最终位置
@@ -710,17 +958,1811 @@ class FFmpegWorker(QObject):
         self._is_cancelled = True
         if self.process and self.process.poll() is None:
             self.process.terminate()
+
+
+ENCODERS = {}
+
+
+def register_encoder(cls):
+    """类装饰器：按name登记帧编码器（界面中按登记顺序列出）"""
+    ENCODERS[cls.name] = cls
+    return cls
+
+
+class FrameEncoder(abc.ABC):
+    """
+    帧编码器接口：把缩放后的帧（BGR数组）编码为该帧函数文件的内容
+
+    使用流程：create(settings) -> begin(settings) -> 每帧 iter_frame(frame, tick) -> finish()
+    settings 字典包含:
+        options (dict): 转换选项
+        frame_size (tuple): 帧尺寸 (宽, 高)
+        spacing (float): 相邻像素之间的方块距离
+        particle_size (float): 粒子尺寸
+        keyframe_interval (int): 关键帧间隔（帧）
+        executor (ThreadPoolExecutor): 共享线程池
+        datapack_dir, world_dir, pack_dir (str): 数据包、存档和资源包目录
+    """
+    name = ""
+    label = ""
+
+    @classmethod
+    @abc.abstractmethod
+    def create(cls, settings):
+        """根据settings创建编码器"""
+
+    def begin(self, settings):
+        """开始编码前准备输出（如清理旧文件），默认无操作"""
+
+    @abc.abstractmethod
+    def iter_frame(self, frame, tick, interlace=None):
+        """逐段生成一帧的命令文本"""
+
+    def encode(self, frame, tick, interlace=None):
+        """将一帧编码为完整的函数文件内容（不含结尾的schedule，供预估和基准测试使用）"""
+        return ''.join(self.iter_frame(frame, tick, interlace)).encode('utf-8')
+
+    def finish(self):
+        """所有帧编码完成后调用（写出汇总文件、等待后台任务），默认无操作"""
+
+    @classmethod
+    def remove_stale_output(cls, settings, active):
+        """
+        完整转换后对每个登记的编码器调用，删除之前转换留下、本次不再使用的输出文件，默认无操作
+
+        参数:
+            settings (dict): 同create
+            active (FrameEncoder): 本次使用的该类编码器；未选择该编码器时为None
+
+        返回:
+            int: 删除的文件数
+        """
+        return 0
+
+    def setup_lines(self, width, height):
+        """init时在原点处执行的命令"""
+        return []
+
+    def cleanup_lines(self, width, height):
+        """del时在原点处执行的命令"""
+        return []
+
+    def describe(self):
+        """返回编码器配置（写入pack.mcmeta）"""
+        return {}
+
+
+@register_encoder
+class ParticleSerializer(FrameEncoder):
+    """
+    粒子命令序列化器：将缩放后的帧转换为 particle 命令
+
+    参数:
+        particle_size (float): 粒子尺寸
+        spacing (float): 相邻像素之间的方块距离
+        compact (bool): 是否使用紧凑格式（最短数值、省略默认参数）
+        actionbar (bool): 是否在每个tick显示 actionbar 标题
+        force (bool): 是否使用 force 显示模式
+    """
+    name = "particle"
+    label = "粒子"
+
+    def __init__(self, particle_size, spacing, compact=False, actionbar=True, force=True):
+        self.particle_size = particle_size
+        self.spacing = spacing
+        self.compact = compact
+        self.actionbar = actionbar
+        self.force = force
+
+        if compact:
+            self.head = "particle dust "
+            self.size_str = self.format_number(particle_size, 2)
+            # 保持与完整格式相同的速度参数；非force时省略默认的normal
+            self.tail = " 0 0 0 3000 1 force\n" if force else " 0 0 0 3000 1\n"
+        else:
+            self.head = "particle minecraft:dust "
+            self.size_str = f"{particle_size:.2f}"
+            self.tail = f" 0 0 0 3000 1 {'force' if force else 'normal'}\n"
+
+        # 颜色分量只有256种取值，预先格式化
+        self.channel_strs = [self.format_number(v / 255) for v in range(256)]
+        self._offset_cache = {}
+        self.color_prefixes = None  # 调色板量化后：颜色(0xRRGGBB) -> 预先拼好的命令前缀
+        self.rows_ws = None  # 行去重时存放行函数（vd:rows/<hash>）的工作区
+        self.row_names = set()
+        self._row_lock = threading.Lock()
+
+    def format_number(self, value, digits=3):
+        """格式化数值；紧凑模式下去掉多余的0（0.500 -> .5）"""
+        text = f"{value:.{digits}f}"
+        if not self.compact:
+            return text
+        text = text.rstrip('0').rstrip('.')
+        if text in ("", "0", "-0"):
+            return "0"
+        if text.startswith("0."):
+            return text[1:]
+        if text.startswith("-0."):
+            return "-" + text[2:]
+        return text
+
+    def format_offset(self, value):
+        """格式化相对坐标（~x）"""
+        number = self.format_number(value)
+        if self.compact and number == "0":
+            return "~"
+        return f"~{number}"
+
+    def offsets(self, count, sign=1):
+        """获取(并缓存)一行/一列的相对坐标字符串"""
+        key = (count, sign)
+        if key not in self._offset_cache:
+            self._offset_cache[key] = [self.format_offset(sign * i * self.spacing) for i in range(count)]
+        return self._offset_cache[key]
+
+    def set_palette(self, palette):
+        """
+        为量化后的帧预先生成每个调色板颜色的命令前缀（颜色和尺寸部分）
+
+        参数:
+            palette: 调色板颜色数组 (N, 3)，BGR顺序
+        """
+        channels = self.channel_strs
+        self.color_prefixes = {
+            (r << 16) | (g << 8) | b: f"{self.head}{channels[r]} {channels[g]} {channels[b]} {self.size_str} "
+            for b, g, r in palette.tolist()
+        }
+
+    def actionbar_line(self, tick):
+        """显示当前tick的actionbar标题命令"""
+        return f'title @a actionbar \"tick:{tick}\"\n'
+
+    def enable_row_dedup(self, rows_dir):
+        """
+        启用行去重：内容相同的像素行只生成一个使用相对坐标的函数 vd:rows/<hash>，
+        帧函数通过 execute positioned 调用（多个分块线程可同时调用）
+        """
+        self.rows_ws = Workspace(rows_dir)
+        self.row_names = set()
+
+    def row_call(self, pixels, x0, y_str, make_text):
+        """返回调用该行函数的命令，行内容第一次出现时写入行函数"""
+        digest = hashlib.sha1(pixels.tobytes())
+        digest.update(struct.pack('>ii', x0, len(pixels)))
+        name = digest.hexdigest()[:16]
+        with self._row_lock:
+            new = name not in self.row_names
+            self.row_names.add(name)
+        if new:
+            self.rows_ws.write_lines(f"{name}.mcfunction", [make_text()], skip_unchanged=True)
+        return f"execute positioned ~ {y_str} ~ run function vd:rows/{name}\n"
+
+    def iter_pixels(self, frame, x0=0, y0=0, interlace=None):
+        """
+        逐行像素生成粒子命令
+
+        参数:
+            frame: BGR数组（整帧或分块）
+            x0, y0 (int): 该数组左上角在整个屏幕中的像素位置
+            interlace (tuple): (隔行数N, 相位)，只输出屏幕行号 % N == 相位 的行；None表示输出整帧
+        """
+        height, width = frame.shape[:2]
+        xs = self.offsets(x0 + width)[x0:]
+        ys = self.offsets(y0 + height, -1)[y0:]
+        channels = self.channel_strs
+        head, size, tail = self.head, self.size_str, self.tail
+
+        if self.color_prefixes is not None:
+            prefixes = self.color_prefixes
+            packed = (frame[..., 2].astype(np.int32) << 16) | (frame[..., 1].astype(np.int32) << 8) | frame[..., 0]
+
+            def row_text(y, y_str):
+                return ''.join([f"{prefixes[color]}{xs[x]} {y_str} ~{tail}" for x, color in enumerate(packed[y].tolist())])
+        else:
+            def row_text(y, y_str):
+                return ''.join([
+                    f"{head}{channels[r]} {channels[g]} {channels[b]} {size} {xs[x]} {y_str} ~{tail}"
+                    for x, (b, g, r) in enumerate(frame[y].tolist())
+                ])
+
+        for y in range(height):
+            if interlace and (y0 + y) % interlace[0] != interlace[1]:
+                continue
+            if self.rows_ws is None:
+                yield row_text(y, ys[y])
+            else:
+                # 行函数在该行所在高度执行，行内的y坐标为~
+                yield self.row_call(frame[y], x0, ys[y], lambda: row_text(y, self.format_offset(0)))
+
+    @classmethod
+    def create(cls, settings):
+        options = settings["options"]
+        serializer = cls(settings["particle_size"], settings["spacing"],
+                         compact=options.get("compact", False),
+                         actionbar=options.get("actionbar", True),
+                         force=options.get("force", True))
+        if options.get("row_dedup", False):
+            serializer.enable_row_dedup(os.path.join(settings["datapack_dir"], "data", "vd", "functions", "rows"))
+        return serializer
+
+    def begin(self, settings):
+        """未启用行去重时删除上次生成的行函数"""
+        if self.rows_ws is None:
+            shutil.rmtree(os.path.join(settings["datapack_dir"], "data", "vd", "functions", "rows"), ignore_errors=True)
+
+    @classmethod
+    def remove_stale_output(cls, settings, active):
+        """
+        删除本次未使用的行函数（只在完整转换后调用，取消时旧帧仍引用这些函数）；
+        未选择粒子编码器或未启用行去重时删除全部行函数
+        """
+        rows_dir = os.path.join(settings["datapack_dir"], "data", "vd", "functions", "rows")
+        if not os.path.isdir(rows_dir):
+            return 0
+        used = active.row_names if active and active.rows_ws is not None else set()
+        removed = 0
+        for entry in list(os.scandir(rows_dir)):
+            name, ext = os.path.splitext(entry.name)
+            if ext == ".mcfunction" and name not in used:
+                os.remove(entry.path)
+                removed += 1
+        if not used and not any(os.scandir(rows_dir)):
+            os.rmdir(rows_dir)
+        return removed
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """逐行像素生成一帧（BGR数组）的命令文本（不含结尾的schedule）"""
+        if self.actionbar:
+            yield self.actionbar_line(tick)
+        yield from self.iter_pixels(frame, interlace=interlace)
+
+    def serialize_frame(self, frame, tick):
+        """将一帧（BGR数组）转换为完整的命令文本（不含结尾的schedule）"""
+        return ''.join(self.iter_frame(frame, tick))
+
+    def describe(self):
+        """返回序列化配置（写入pack.mcmeta）"""
+        return {
+            "compact": self.compact,
+            "actionbar": self.actionbar,
+            "force": self.force,
+            "row_functions": len(self.row_names) if self.rows_ws is not None else None
+        }
+
+
+@register_encoder
+class BlockRenderer(FrameEncoder):
+    """
+    方块墙渲染器：把每个像素映射为颜色最接近的方块（混凝土/羊毛/陶瓦），
+    每帧只对与上一帧不同的像素输出setblock，同一行中相邻的相同方块合并为一条fill
+
+    参数:
+        palette (str): 调色板，"concrete" / "wool" / "terracotta" / "all"
+        actionbar (bool): 是否在每个tick显示 actionbar 标题
+        keyframe_interval (int): 每隔多少帧输出一次完整画面（便于跳转后恢复画面），0表示只有第一帧
+    """
+    name = "block"
+    label = "方块墙（仅更新变化的像素）"
+    COLORS = ("white", "orange", "magenta", "light_blue", "yellow", "lime", "pink", "gray",
+              "light_gray", "cyan", "purple", "blue", "brown", "green", "red", "black")
+    # 各方块贴图的平均颜色 (R, G, B)，顺序与COLORS一致
+    PALETTES = {
+        "concrete": [(207, 213, 214), (224, 97, 0), (169, 48, 159), (35, 137, 198),
+                     (240, 175, 21), (94, 168, 24), (213, 101, 142), (54, 57, 61),
+                     (125, 125, 115), (21, 119, 136), (100, 31, 156), (44, 46, 143),
+                     (96, 59, 31), (73, 91, 36), (142, 32, 32), (8, 10, 15)],
+        "wool": [(233, 236, 236), (240, 118, 19), (189, 68, 179), (58, 175, 217),
+                 (248, 197, 39), (112, 185, 25), (237, 141, 172), (62, 68, 71),
+                 (142, 142, 134), (21, 137, 145), (121, 42, 172), (53, 57, 157),
+                 (114, 71, 40), (84, 109, 27), (160, 39, 34), (20, 21, 25)],
+        "terracotta": [(209, 178, 161), (161, 83, 37), (149, 88, 108), (113, 108, 137),
+                       (186, 133, 35), (103, 117, 52), (161, 78, 78), (57, 42, 35),
+                       (135, 106, 97), (86, 91, 91), (118, 70, 86), (74, 59, 91),
+                       (77, 51, 35), (76, 83, 42), (143, 61, 46), (37, 22, 16)]
+    }
+
+    def __init__(self, palette="all", actionbar=True, keyframe_interval=0):
+        self.palette = palette
+        self.actionbar = actionbar
+        self.keyframe_interval = keyframe_interval
+        self.blocks, colors = self.build_palette(palette)
+        self.lut = self.build_lut(colors)
+        self.previous = None
+
+    @classmethod
+    def create(cls, settings):
+        options = settings["options"]
+        return cls(palette=options.get("block_palette", "all"),
+                   actionbar=options.get("actionbar", True),
+                   keyframe_interval=settings["keyframe_interval"])
+
+    @classmethod
+    def build_palette(cls, palette):
+        """返回(方块ID列表, RGB颜色数组)"""
+        names = list(cls.PALETTES) if palette == "all" else [palette]
+        blocks, colors = [], []
+        for name in names:
+            blocks.extend(f"{color}_{name}" for color in cls.COLORS)
+            colors.extend(cls.PALETTES[name])
+        if "terracotta" in names:
+            blocks.append("terracotta")
+            colors.append((152, 94, 67))
+        return blocks, np.array(colors, dtype=np.float32)
+
+    @staticmethod
+    def build_lut(colors):
+        """为5位精度的所有BGR颜色预先计算最近的调色板索引（32x32x32查找表，按蓝色分层计算以控制内存）"""
+        levels = np.arange(32, dtype=np.float32) * 8 + 4
+        g, r = np.meshgrid(levels, levels, indexing='ij')
+        lut = np.empty((32, 32, 32), dtype=np.uint8)
+        for b_index, b in enumerate(levels):
+            rgb = np.stack([r, g, np.full_like(r, b)], axis=-1).reshape(-1, 1, 3)
+            distances = ((rgb - colors[None, :, :]) ** 2).sum(axis=-1)
+            lut[b_index] = distances.argmin(axis=1).reshape(32, 32)
+        return lut
+
+    def map_frame(self, frame):
+        """将BGR帧映射为方块索引数组"""
+        return self.lut[frame[..., 0] >> 3, frame[..., 1] >> 3, frame[..., 2] >> 3]
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """逐行生成本帧变化像素的setblock/fill命令"""
+        if self.actionbar:
+            yield f'title @a actionbar \"tick:{tick}\"\n'
+        
+        indices = self.map_frame(frame)
+        keyframe = self.previous is None or (self.keyframe_interval and tick % self.keyframe_interval == 0)
+        changed = np.ones(indices.shape, dtype=bool) if keyframe else indices != self.previous
+        self.previous = indices
+        
+        width = indices.shape[1]
+        blocks = self.blocks
+        for y in np.flatnonzero(changed.any(axis=1)).tolist():
+            row = indices[y]
+            # 按相同方块划分行程，只输出包含变化像素的行程
+            boundaries = np.flatnonzero(np.diff(row)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [width]))
+            run_changed = np.add.reduceat(changed[y].astype(np.int32), starts) > 0
+            parts = []
+            for x0, x1, index in zip(starts[run_changed].tolist(), ends[run_changed].tolist(),
+                                     row[starts[run_changed]].tolist()):
+                if x1 - x0 == 1:
+                    parts.append(f"setblock ~{x0} ~{-y} ~ {blocks[index]}\n")
+                else:
+                    parts.append(f"fill ~{x0} ~{-y} ~ ~{x1 - 1} ~{-y} ~ {blocks[index]}\n")
+            yield ''.join(parts)
+
+    def cleanup_lines(self, width, height):
+        """清除方块墙的命令（在原点处执行）"""
+        return [f"fill ~ ~{-y} ~ ~{width - 1} ~{-y} ~ air\n" for y in range(height)]
+
+    def describe(self):
+        """返回渲染器配置（写入pack.mcmeta）"""
+        return {
+            "palette": self.palette,
+            "keyframe_interval": self.keyframe_interval
+        }
+
+
+@register_encoder
+class TextDisplayRenderer(FrameEncoder):
+    """
+    文本展示实体渲染器：初始化时每个画面行召唤一个text_display实体，
+    每帧用一条data merge把整行写成彩色"█"字符组成的JSON文本，相邻同色像素合并为一个文本组件，
+    每tick的命令数从 宽x高 降为 高（未变化的行不输出）
+
+    需要 Minecraft 1.19.4 及以上版本（text_display实体）
+
+    参数:
+        spacing (float): 像素间距（方块），用于缩放字符使像素近似为正方形
+        actionbar (bool): 是否在每个tick显示 actionbar 标题
+        color_bits (int): 每个颜色通道保留的位数（默认8为无损），越少相邻同色越多、命令越短
+        keyframe_interval (int): 每隔多少帧输出一次完整画面，0表示只有第一帧
+    """
+    name = "text_display"
+    label = "文本展示实体（每行一条命令，1.19.4+）"
+    # 默认字体中"█"宽6像素（含间隔）、行高9像素，text_display中1像素为1/40方块
+    GLYPH_WIDTH = 6 / 40
+    LINE_HEIGHT = 9 / 40
+
+    def __init__(self, spacing, actionbar=True, color_bits=8, keyframe_interval=0):
+        self.spacing = spacing
+        self.actionbar = actionbar
+        self.color_bits = max(1, min(8, int(color_bits)))
+        self.keyframe_interval = keyframe_interval
+        self.previous = None
+
+    @classmethod
+    def create(cls, settings):
+        return cls(settings["spacing"],
+                   actionbar=settings["options"].get("actionbar", True),
+                   keyframe_interval=settings["keyframe_interval"])
+
+    def quantize(self, frame):
+        """降低颜色精度（取每档中点），返回0xRRGGBB整数数组"""
+        shift = 8 - self.color_bits
+        q = ((frame.astype(np.uint32) >> shift) << shift) | ((1 << shift) >> 1)
+        return (q[..., 2] << 16) | (q[..., 1] << 8) | q[..., 0]
+
+    def row_text(self, row):
+        """把一行颜色合并为JSON文本组件（首个空字符串避免样式继承）"""
+        boundaries = np.flatnonzero(np.diff(row)) + 1
+        starts = np.concatenate(([0], boundaries)).tolist()
+        ends = np.concatenate((boundaries, [len(row)])).tolist()
+        parts = ['""']
+        for x0, x1, color in zip(starts, ends, row[starts].tolist()):
+            parts.append(f'{{"text":"{"█" * (x1 - x0)}","color":"#{color:06x}"}}')
+        return f"[{','.join(parts)}]"
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """逐行生成本帧变化行的data merge命令"""
+        if self.actionbar:
+            yield f'title @a actionbar \"tick:{tick}\"\n'
+        
+        colors = self.quantize(frame)
+        keyframe = self.previous is None or (self.keyframe_interval and tick % self.keyframe_interval == 0)
+        rows = range(colors.shape[0]) if keyframe else \
+            np.flatnonzero((colors != self.previous).any(axis=1)).tolist()
+        self.previous = colors
+        
+        for y in rows:
+            yield (f"data merge entity @e[type=text_display,tag=vd_row{y},limit=1] "
+                   f"{{text:'{self.row_text(colors[y])}'}}\n")
+
+    def setup_lines(self, width, height):
+        """为每一行召唤text_display实体（在原点处执行，画面水平居中于原点右侧）"""
+        scale_x = self.spacing / self.GLYPH_WIDTH
+        scale_y = self.spacing / self.LINE_HEIGHT
+        center = self.format_number(width * self.spacing / 2)
+        transformation = (
+            "transformation:{left_rotation:[0f,0f,0f,1f],right_rotation:[0f,0f,0f,1f],"
+            f"translation:[0f,0f,0f],scale:[{self.format_number(scale_x)}f,{self.format_number(scale_y)}f,1f]}}"
+        )
+        lines = ["kill @e[type=text_display,tag=vd_row]\n"]
+        for y in range(height):
+            lines.append(
+                f"summon text_display ~{center} ~{self.format_number(-y * self.spacing)} ~ "
+                f"{{Tags:[\"vd_row\",\"vd_row{y}\"],line_width:{width * 6 + 6},background:0,"
+                f"{transformation},text:'\"\"'}}\n"
+            )
+        return lines
+
+    def cleanup_lines(self, width, height):
+        """移除所有行实体"""
+        return ["kill @e[type=text_display,tag=vd_row]\n"]
+
+    @staticmethod
+    def format_number(value):
+        """格式化数字，去掉多余的0"""
+        return f"{value:.4f}".rstrip('0').rstrip('.') or "0"
+
+    def describe(self):
+        """返回渲染器配置（写入pack.mcmeta）"""
+        return {
+            "spacing": self.spacing,
+            "color_bits": self.color_bits,
+            "keyframe_interval": self.keyframe_interval
+        }
+
+
+def nbt_tag(tag_type, name):
+    """返回NBT命名标签的头部（类型 + 名称）"""
+    encoded = name.encode('utf-8')
+    return struct.pack('>bH', tag_type, len(encoded)) + encoded
+
+
+@register_encoder
+class MapRenderer(FrameEncoder):
+    """
+    地图画渲染器：把每帧切成128x128的地图块，量化到地图颜色表后写成存档的 data/map_N.dat，
+    完全相同的地图在各帧之间复用同一个ID；帧函数只需替换物品展示框中的地图ID，
+    每tick的命令数只与变化的地图块数有关，与分辨率无关
+
+    地图ID从 id_start 开始连续分配（重新转换时覆盖同一范围），不修改存档的 idcounts.dat；
+    写入过的ID范围记录在存档 data/vd_maps.json 中，之后的转换据此删除不再使用的地图文件
+
+    参数:
+        world_dir (str): 存档目录
+        actionbar (bool): 是否在每个tick显示 actionbar 标题
+        keyframe_interval (int): 每隔多少帧输出一次完整画面，0表示只有第一帧
+        id_start (int): 第一个地图ID
+    """
+    name = "map"
+    label = "地图画（写入存档地图文件）"
+    MAP_SIZE = 128
+    DATA_VERSION = 3120  # 1.19.2
+    # 地图基础颜色 (R, G, B)，索引即颜色ID（0为透明，不参与匹配）
+    BASE_COLORS = [
+        (127, 178, 56), (247, 233, 163), (199, 199, 199), (255, 0, 0), (160, 160, 255),
+        (167, 167, 167), (0, 124, 0), (255, 255, 255), (164, 168, 184), (151, 109, 77),
+        (112, 112, 112), (64, 64, 255), (143, 119, 72), (255, 252, 245), (216, 127, 51),
+        (178, 76, 216), (102, 153, 216), (229, 229, 51), (127, 204, 25), (242, 127, 165),
+        (76, 76, 76), (153, 153, 153), (76, 127, 153), (127, 63, 178), (51, 76, 178),
+        (102, 76, 51), (102, 127, 51), (153, 51, 51), (25, 25, 25), (250, 238, 77),
+        (92, 219, 213), (74, 128, 255), (0, 217, 58), (129, 86, 49), (112, 2, 0),
+        (209, 177, 161), (159, 82, 36), (149, 87, 108), (112, 108, 138), (186, 133, 36),
+        (103, 117, 53), (160, 77, 78), (57, 41, 35), (135, 107, 98), (87, 92, 92),
+        (122, 73, 88), (76, 62, 92), (76, 50, 35), (76, 82, 42), (142, 60, 46),
+        (37, 22, 16), (189, 48, 49), (148, 63, 97), (92, 25, 29), (22, 126, 134),
+        (58, 142, 140), (86, 44, 62), (20, 180, 133), (100, 100, 100), (216, 175, 147),
+        (127, 167, 150)
+    ]
+    SHADES = (180, 220, 255, 135)
+    LEDGER = "vd_maps.json"
+
+    def __init__(self, world_dir, actionbar=True, keyframe_interval=0, id_start=30000):
+        self.maps_dir = os.path.join(world_dir, "data")
+        self.actionbar = actionbar
+        self.keyframe_interval = keyframe_interval
+        self.id_start = id_start
+        self.map_ids = {}  # 地图内容摘要 -> 地图ID
+        self.previous = None
+        self.color_bytes, colors = self.build_palette()
+        self.lut = BlockRenderer.build_lut(colors)
+
+    @classmethod
+    def create(cls, settings):
+        return cls(settings["world_dir"],
+                   actionbar=settings["options"].get("actionbar", True),
+                   keyframe_interval=settings["keyframe_interval"])
+
+    @classmethod
+    def build_palette(cls):
+        """返回(地图颜色字节数组, RGB颜色数组)，颜色字节 = 基础颜色ID * 4 + 明暗"""
+        color_bytes, colors = [], []
+        for base_id, rgb in enumerate(cls.BASE_COLORS, start=1):
+            for shade, factor in enumerate(cls.SHADES):
+                color_bytes.append(base_id * 4 + shade)
+                colors.append(tuple(c * factor // 255 for c in rgb))
+        return np.array(color_bytes, dtype=np.uint8), np.array(colors, dtype=np.float32)
+
+    @staticmethod
+    def grid_size(width, height):
+        """返回地图块的列数和行数"""
+        return math.ceil(width / MapRenderer.MAP_SIZE), math.ceil(height / MapRenderer.MAP_SIZE)
+
+    @staticmethod
+    def encode_map(colors, data_version):
+        """把128x128的颜色字节编码为gzip压缩的地图NBT"""
+        tag = nbt_tag
+        dimension = b"minecraft:overworld"
+        payload = b''.join([
+            tag(10, ""), tag(10, "data"),
+            tag(1, "scale"), b'\x00',
+            tag(8, "dimension"), struct.pack('>H', len(dimension)), dimension,
+            tag(1, "locked"), b'\x01',
+            tag(1, "trackingPosition"), b'\x00',
+            tag(1, "unlimitedTracking"), b'\x00',
+            tag(3, "xCenter"), struct.pack('>i', 0),
+            tag(3, "zCenter"), struct.pack('>i', 0),
+            tag(9, "banners"), struct.pack('>bi', 0, 0),
+            tag(9, "frames"), struct.pack('>bi', 0, 0),
+            tag(7, "colors"), struct.pack('>i', len(colors)), colors,
+            b'\x00',
+            tag(3, "DataVersion"), struct.pack('>i', data_version),
+            b'\x00'
+        ])
+        return gzip.compress(payload, compresslevel=6, mtime=0)
+
+    def map_id(self, colors):
+        """返回地图内容对应的ID，新内容时写入map_N.dat"""
+        key = hashlib.sha1(colors).digest()
+        map_id = self.map_ids.get(key)
+        if map_id is None:
+            map_id = self.id_start + len(self.map_ids)
+            self.map_ids[key] = map_id
+            os.makedirs(self.maps_dir, exist_ok=True)
+            with open(os.path.join(self.maps_dir, f"map_{map_id}.dat"), 'wb') as f:
+                f.write(self.encode_map(colors, self.DATA_VERSION))
+        return map_id
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """写出本帧的地图文件，并生成替换变化地图块的命令"""
+        if self.actionbar:
+            yield f'title @a actionbar \"tick:{tick}\"\n'
+        
+        size = self.MAP_SIZE
+        height, width = frame.shape[:2]
+        cols, rows = self.grid_size(width, height)
+        indices = self.lut[frame[..., 0] >> 3, frame[..., 1] >> 3, frame[..., 2] >> 3]
+        canvas = np.zeros((rows * size, cols * size), dtype=np.uint8)  # 不足部分为透明
+        canvas[:height, :width] = self.color_bytes[indices]
+        
+        ids = np.empty((rows, cols), dtype=np.int64)
+        for ty in range(rows):
+            for tx in range(cols):
+                block = np.ascontiguousarray(canvas[ty * size:(ty + 1) * size, tx * size:(tx + 1) * size])
+                ids[ty, tx] = self.map_id(block.tobytes())
+        
+        keyframe = self.previous is None or (self.keyframe_interval and tick % self.keyframe_interval == 0)
+        changed = np.ones(ids.shape, dtype=bool) if keyframe else ids != self.previous
+        self.previous = ids
+        for ty, tx in zip(*np.nonzero(changed)):
+            yield (f"data modify entity @e[type=item_frame,tag=vd_map_{tx}_{ty},limit=1] "
+                   f"Item.tag.map set value {ids[ty, tx]}\n")
+
+    @staticmethod
+    def load_ledger(path):
+        """读取已写入的地图ID范围 {"first": 起始ID, "end": 结束ID（不含）}；不存在时返回None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                ledger = json.load(f)
+            return ledger if {"first", "end"} <= ledger.keys() else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def finish(self):
+        """记录本次写入过的地图ID范围（取消或出错时同样调用，与之前记录的范围合并）"""
+        if not self.map_ids:
+            return
+        path = os.path.join(self.maps_dir, self.LEDGER)
+        first, end = self.id_start, self.id_start + len(self.map_ids)
+        ledger = self.load_ledger(path)
+        if ledger:
+            first, end = min(first, ledger["first"]), max(end, ledger["end"])
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"first": first, "end": end}, f)
+
+    @classmethod
+    def remove_stale_output(cls, settings, active):
+        """删除记录范围内本次未使用的地图文件，并把记录缩小为本次使用的范围"""
+        maps_dir = os.path.join(settings["world_dir"], "data")
+        path = os.path.join(maps_dir, cls.LEDGER)
+        ledger = cls.load_ledger(path)
+        if not ledger:
+            return 0
+        keep = range(active.id_start, active.id_start + len(active.map_ids)) if active else range(0)
+        removed = 0
+        for map_id in range(ledger["first"], ledger["end"]):
+            map_path = os.path.join(maps_dir, f"map_{map_id}.dat")
+            if map_id not in keep and os.path.exists(map_path):
+                os.remove(map_path)
+                removed += 1
+        if keep:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"first": keep.start, "end": keep.stop}, f)
+        else:
+            os.remove(path)
+        return removed
+
+    def setup_lines(self, width, height):
+        """在原点处摆放一面朝南的物品展示框墙（每个地图块一个）"""
+        cols, rows = self.grid_size(width, height)
+        lines = ["kill @e[type=item_frame,tag=vd_map]\n"]
+        for ty in range(rows):
+            for tx in range(cols):
+                lines.append(
+                    f"summon item_frame ~{tx} ~{-ty} ~ {{Facing:3b,Fixed:1b,Invisible:1b,"
+                    f"Tags:[\"vd_map\",\"vd_map_{tx}_{ty}\"],"
+                    f"Item:{{id:\"minecraft:filled_map\",Count:1b,tag:{{map:{self.id_start}}}}}}}\n"
+                )
+        return lines
+
+    def cleanup_lines(self, width, height):
+        """移除所有展示框"""
+        return ["kill @e[type=item_frame,tag=vd_map]\n"]
+
+    def describe(self):
+        """返回渲染器配置（写入pack.mcmeta）"""
+        return {
+            "id_start": self.id_start,
+            "map_count": len(self.map_ids),
+            "keyframe_interval": self.keyframe_interval
+        }
+
+
+@register_encoder
+class StructureRenderer(BlockRenderer):
+    """
+    结构模板渲染器：把每帧变化的像素（包围盒内未变化的位置为结构空位）写成
+    data/vd/structures 下的结构 .nbt 文件，帧函数只需一条 place template；
+    内容相同的结构只保存一份，压缩和写入在线程池中并行进行
+
+    参数:
+        structures_dir (str): 结构文件目录（旧文件会被清除）
+        executor (ThreadPoolExecutor): 写入结构文件的线程池
+        palette, actionbar, keyframe_interval: 同 BlockRenderer
+    """
+    name = "structure"
+    label = "结构模板（每帧一条place template）"
+    DATA_VERSION = 3120  # 1.19.2
+    # 每个方块记录：{pos:[x,y,z], state:N}，定长36字节，可向量化生成
+    BLOCK_DTYPE = np.dtype({
+        'names': ['pos_header', 'x', 'y', 'z', 'state_header', 'state'],
+        'formats': ['S11', '>i4', '>i4', '>i4', 'S8', '>i4'],
+        'offsets': [0, 11, 15, 19, 23, 31],
+        'itemsize': 36
+    })
+    POS_HEADER = nbt_tag(9, "pos") + b'\x03' + struct.pack('>i', 3)
+    STATE_HEADER = nbt_tag(3, "state")
+
+    def __init__(self, structures_dir, executor, palette="all", actionbar=True, keyframe_interval=0):
+        super().__init__(palette, actionbar, keyframe_interval)
+        self.structures_dir = structures_dir
+        self.executor = executor
+        self.structure_names = {}  # 结构内容摘要 -> 结构名
+        self.futures = []
+        self.palette_nbt = b''.join(
+            nbt_tag(8, "Name") + struct.pack('>H', len(f"minecraft:{block}")) + f"minecraft:{block}".encode('utf-8') + b'\x00'
+            for block in self.blocks)
+
+    @classmethod
+    def create(cls, settings):
+        options = settings["options"]
+        return cls(os.path.join(settings["datapack_dir"], "data", "vd", "structures"), settings["executor"],
+                   palette=options.get("block_palette", "all"),
+                   actionbar=options.get("actionbar", True),
+                   keyframe_interval=settings["keyframe_interval"])
+
+    def begin(self, settings):
+        """清除旧的结构文件"""
+        shutil.rmtree(self.structures_dir, ignore_errors=True)
+        os.makedirs(self.structures_dir, exist_ok=True)
+
+    def encode_structure(self, xs, ys, states, size):
+        """把方块坐标和调色板索引编码为结构NBT（未压缩）"""
+        records = np.zeros(len(xs), dtype=self.BLOCK_DTYPE)
+        records['pos_header'] = self.POS_HEADER
+        records['x'] = xs
+        records['y'] = ys
+        records['state_header'] = self.STATE_HEADER
+        records['state'] = states
+        return b''.join([
+            nbt_tag(10, ""),
+            nbt_tag(3, "DataVersion"), struct.pack('>i', self.DATA_VERSION),
+            nbt_tag(9, "size"), struct.pack('>biiii', 3, 3, *size),
+            nbt_tag(9, "palette"), struct.pack('>bi', 10, len(self.blocks)), self.palette_nbt,
+            nbt_tag(9, "blocks"), struct.pack('>bi', 10, len(records)), records.tobytes(),
+            nbt_tag(9, "entities"), struct.pack('>bi', 0, 0),
+            b'\x00'
+        ])
+
+    def write_structure(self, name, payload):
+        """压缩并写入结构文件（在线程池中执行）"""
+        with open(os.path.join(self.structures_dir, f"{name}.nbt"), 'wb') as f:
+            f.write(gzip.compress(payload, compresslevel=6, mtime=0))
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """生成放置本帧变化区域结构的命令"""
+        if self.actionbar:
+            yield f'title @a actionbar \"tick:{tick}\"\n'
+        
+        indices = self.map_frame(frame)
+        keyframe = self.previous is None or (self.keyframe_interval and tick % self.keyframe_interval == 0)
+        changed = np.ones(indices.shape, dtype=bool) if keyframe else indices != self.previous
+        self.previous = indices
+        
+        rows, cols = np.nonzero(changed)
+        if len(rows) == 0:
+            return
+        x0, x1 = int(cols.min()), int(cols.max())
+        y0, y1 = int(rows.min()), int(rows.max())
+        # 结构的y轴向上，画面第y1行位于结构底部
+        payload = self.encode_structure(cols - x0, y1 - rows, indices[rows, cols],
+                                        (x1 - x0 + 1, y1 - y0 + 1, 1))
+        key = hashlib.sha1(payload).digest()
+        name = self.structure_names.get(key)
+        if name is None:
+            name = f"f{len(self.structure_names)}"
+            self.structure_names[key] = name
+            self.futures.append(self.executor.submit(self.write_structure, name, payload))
+            self.check_futures()
+        yield f"place template vd:{name} ~{x0} ~{-y1} ~\n"
+
+    def check_futures(self, wait=False):
+        """检查已完成的写入任务，出错时抛出异常"""
+        pending = []
+        for future in self.futures:
+            if wait or future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self.futures = pending
+
+    def finish(self):
+        """等待所有结构文件写入完成"""
+        self.check_futures(wait=True)
+
+    @classmethod
+    def remove_stale_output(cls, settings, active):
+        """删除编号不小于本次结构数的结构文件；未选择结构编码器时删除全部结构文件"""
+        structures_dir = os.path.join(settings["datapack_dir"], "data", "vd", "structures")
+        if not os.path.isdir(structures_dir):
+            return 0
+        count = len(active.structure_names) if active else 0
+        removed = 0
+        for entry in list(os.scandir(structures_dir)):
+            match = re.fullmatch(r"f(\d+)\.nbt", entry.name)
+            if match and int(match.group(1)) >= count:
+                os.remove(entry.path)
+                removed += 1
+        if not active and not any(os.scandir(structures_dir)):
+            os.rmdir(structures_dir)
+        return removed
+
+    def describe(self):
+        """返回渲染器配置（写入pack.mcmeta）"""
+        info = super().describe()
+        info["structures"] = len(self.structure_names)
+        return info
+
+
+@register_encoder
+class FontAtlasRenderer(FrameEncoder):
+    """
+    字体贴图渲染器：把缩放后的帧拼成图集PNG写入资源包，并注册为自定义字体（vd:video）中的字形，
+    每tick只需一条data merge把屏幕text_display的文本换成当前帧对应的字符；
+    内容相同的帧共用一个字形，图集的拼接和PNG编码在线程池中并行进行
+
+    需要在游戏中启用生成的资源包（修改后需按F3+T重新加载）
+
+    参数:
+        pack_dir (str): 资源包根目录
+        executor (ThreadPoolExecutor): 编码图集的线程池
+        spacing (float): 像素间距（方块），决定屏幕在世界中的大小
+        actionbar (bool): 是否在每个tick显示 actionbar 标题
+        atlas_size (int): 图集的最大边长（像素）
+    """
+    name = "font"
+    label = "资源包字体贴图（每tick一条命令）"
+    FONT = "vd:video"
+
+    def __init__(self, pack_dir, executor, spacing, actionbar=True, atlas_size=4096):
+        self.textures_dir = os.path.join(pack_dir, "assets", "vd", "textures", "frames")
+        self.font_path = os.path.join(pack_dir, "assets", "vd", "font", "video.json")
+        self.executor = executor
+        self.spacing = spacing
+        self.actionbar = actionbar
+        self.atlas_size = atlas_size
+        self.glyphs = {}  # 帧内容摘要 -> 字形序号
+        self.providers = []
+        self.futures = []
+        self.atlas = None
+        self.grid = None
+
+    @classmethod
+    def create(cls, settings):
+        return cls(settings["pack_dir"], settings["executor"], settings["spacing"],
+                   actionbar=settings["options"].get("actionbar", True))
+
+    def begin(self, settings):
+        """清除旧的图集"""
+        shutil.rmtree(self.textures_dir, ignore_errors=True)
+        os.makedirs(self.textures_dir, exist_ok=True)
+
+    @classmethod
+    def remove_stale_output(cls, settings, active):
+        """未选择字体编码器时删除之前生成的图集和字体定义（选择时begin已清除旧图集）"""
+        if active:
+            return 0
+        textures_dir = os.path.join(settings["pack_dir"], "assets", "vd", "textures", "frames")
+        font_path = os.path.join(settings["pack_dir"], "assets", "vd", "font", "video.json")
+        removed = 0
+        if os.path.isdir(textures_dir):
+            removed += sum(len(files) for _, _, files in os.walk(textures_dir))
+            shutil.rmtree(textures_dir, ignore_errors=True)
+        if os.path.exists(font_path):
+            os.remove(font_path)
+            removed += 1
+        return removed
+
+    @staticmethod
+    def glyph_char(index):
+        """第index个字形的字符（先用BMP私用区，用完后使用补充私用区A）"""
+        return chr(0xE000 + index) if index < 0x1900 else chr(0xF0000 + index - 0x1900)
+
+    def glyph_for(self, frame):
+        """返回帧对应的字形序号，新帧放入当前图集，图集满时交给线程池编码"""
+        key = hashlib.sha1(frame.tobytes()).digest()
+        index = self.glyphs.get(key)
+        if index is not None:
+            return index
+        
+        height, width = frame.shape[:2]
+        if self.grid is None:
+            self.grid = (max(1, self.atlas_size // width), max(1, self.atlas_size // height))
+        cols, rows = self.grid
+        index = len(self.glyphs)
+        self.glyphs[key] = index
+        slot = index % (cols * rows)
+        if slot == 0:
+            # 未使用的格子保持透明，对应字符为\0
+            self.atlas = np.zeros((rows * height, cols * width, 4), dtype=np.uint8)
+        y, x = divmod(slot, cols)
+        self.atlas[y * height:(y + 1) * height, x * width:(x + 1) * width, :3] = frame
+        self.atlas[y * height:(y + 1) * height, x * width:(x + 1) * width, 3] = 255
+        if slot == cols * rows - 1:
+            self.flush_atlas(height)
+        return index
+
+    def flush_atlas(self, glyph_height):
+        """把当前图集交给线程池编码写入，并登记字体提供器"""
+        if self.atlas is None:
+            return
+        cols, rows = self.grid
+        number = len(self.providers)
+        first = number * cols * rows
+        chars = []
+        for y in range(rows):
+            row = [self.glyph_char(first + y * cols + x) if first + y * cols + x < len(self.glyphs) else "\0"
+                   for x in range(cols)]
+            chars.append(''.join(row))
+        self.providers.append({
+            "type": "bitmap",
+            "file": f"vd:frames/atlas_{number}.png",
+            "height": glyph_height,
+            "ascent": glyph_height,
+            "chars": chars
+        })
+        path = os.path.join(self.textures_dir, f"atlas_{number}.png")
+        self.futures.append(self.executor.submit(cv2.imwrite, path, self.atlas))
+        self.atlas = None
+
+    def iter_frame(self, frame, tick, interlace=None):
+        """生成把屏幕文本换成本帧字形的命令"""
+        if self.actionbar:
+            yield f'title @a actionbar \"tick:{tick}\"\n'
+        # JSON转义（\uXXXX）位于SNBT字符串中，反斜杠需要再转义一次
+        char = json.dumps(self.glyph_char(self.glyph_for(frame))).replace('\\', '\\\\')
+        yield (f"data merge entity @e[type=text_display,tag=vd_screen,limit=1] "
+               f"{{text:'{{\"text\":{char},\"font\":\"{self.FONT}\"}}'}}\n")
+
+    def finish(self):
+        """写出最后一个图集和字体定义，等待所有PNG编码完成"""
+        if self.atlas is not None:
+            self.flush_atlas(self.atlas.shape[0] // self.grid[1])
+        os.makedirs(os.path.dirname(self.font_path), exist_ok=True)
+        with open(self.font_path, 'w', encoding='utf-8') as f:
+            json.dump({"providers": self.providers}, f, indent=2)
+        for future in self.futures:
+            if not future.result():
+                raise RuntimeError("写入字体图集失败")
+        self.futures = []
+
+    def setup_lines(self, width, height):
+        """召唤显示画面的text_display（在原点处执行，覆盖与粒子画面相同的区域）"""
+        scale = TextDisplayRenderer.format_number(self.spacing * 40)  # 字体中1像素为1/40方块
+        center = TextDisplayRenderer.format_number(width * self.spacing / 2)
+        bottom = TextDisplayRenderer.format_number(-height * self.spacing)
+        return [
+            "kill @e[type=text_display,tag=vd_screen]\n",
+            f"summon text_display ~{center} ~{bottom} ~ {{Tags:[\"vd_screen\"],background:0,line_width:{width + 1},"
+            "transformation:{left_rotation:[0f,0f,0f,1f],right_rotation:[0f,0f,0f,1f],"
+            f"translation:[0f,0f,0f],scale:[{scale}f,{scale}f,1f]}},text:'\"\"'}}\n"
+        ]
+
+    def cleanup_lines(self, width, height):
+        """移除屏幕实体"""
+        return ["kill @e[type=text_display,tag=vd_screen]\n"]
+
+    def describe(self):
+        """返回渲染器配置（写入pack.mcmeta）"""
+        return {
+            "font": self.FONT,
+            "glyphs": len(self.glyphs),
+            "atlases": len(self.providers)
+        }
+
+
+class PaletteQuantizer:
+    """
+    调色板量化：把缩放后的帧映射到N种颜色（固定的均匀色格或按视频k-means求出的调色板），
+    可选4x4有序（Bayer）抖动；颜色分配通过32x32x32查找表在所有帧之间复用
+
+    参数:
+        colors (int): 调色板颜色数（固定调色板恰好为该数，见fixed_palette）
+        mode (str): "kmeans" 或 "fixed"
+        dither (bool): 是否使用有序抖动
+    """
+    BAYER = np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]], dtype=np.float32) / 16 - 0.5
+
+    def __init__(self, colors=16, mode="kmeans", dither=False):
+        self.colors = max(2, int(colors))
+        self.mode = mode
+        self.dither = dither
+        self._dither_cache = {}
+        self.set_palette(self.fixed_palette(self.colors))
+
+    @staticmethod
+    def fixed_palette(colors):
+        """
+        构造恰好colors种颜色的固定调色板（BGR）：先取各通道均匀分级的色格
+        （分级数之积不超过colors，积相同时优先各通道均衡，其次绿、红通道分级更多），
+        剩余名额依次补入与已有颜色距离最远的灰度
+        """
+        best, levels = None, None
+        for g in range(2, colors + 1):
+            for r in range(2, colors // g + 1):
+                for b in range(2, colors // (g * r) + 1):
+                    key = (g * r * b, min(g, r, b), g, r)
+                    if best is None or key > best:
+                        best, levels = key, (b, g, r)
+        grays = np.repeat(np.arange(256, dtype=np.float32)[:, None], 3, axis=1)
+        if levels:
+            steps = [np.linspace(0, 255, n).round() for n in levels]
+            palette = [np.array([b, g, r], dtype=np.float32)
+                       for b in steps[0] for g in steps[1] for r in steps[2]]
+            distance = ((grays[:, None, :] - np.array(palette)[None]) ** 2).sum(axis=2).min(axis=1)
+        else:
+            # 少于8色时只用灰度
+            palette = []
+            distance = np.full(256, np.inf, dtype=np.float32)
+        while len(palette) < colors:
+            pick = grays[int(np.argmax(distance))]
+            palette.append(pick)
+            distance = np.minimum(distance, ((grays - pick) ** 2).sum(axis=1))
+        return np.array(palette).astype(np.uint8)
+
+    def set_palette(self, palette):
+        """设置调色板（BGR）并重建查找表"""
+        self.palette = palette
+        self.lut = BlockRenderer.build_lut(palette[:, ::-1].astype(np.float32))
+        # 抖动幅度约为相邻调色板颜色的间距
+        self.spread = 256 / max(1.0, len(palette) ** (1 / 3))
+        self._dither_cache.clear()
+
+    def fit(self, frames, max_pixels=200000):
+        """用k-means从抽样帧中求出调色板（fixed模式下不做任何事）"""
+        if self.mode != "kmeans":
+            return
+        pixels = np.concatenate([frame.reshape(-1, 3) for frame in frames]).astype(np.float32)
+        if len(pixels) > max_pixels:
+            pixels = pixels[np.random.default_rng(0).choice(len(pixels), max_pixels, replace=False)]
+        k = min(self.colors, len(np.unique(pixels, axis=0)))
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+        _, _, centers = cv2.kmeans(pixels, k, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+        self.set_palette(np.clip(centers.round(), 0, 255).astype(np.uint8))
+
+    def indices(self, frame):
+        """返回帧中每个像素的调色板索引"""
+        if self.dither:
+            height, width = frame.shape[:2]
+            offset = self._dither_cache.get((height, width))
+            if offset is None:
+                tiled = np.tile(self.BAYER, (height // 4 + 1, width // 4 + 1))[:height, :width]
+                offset = self._dither_cache[(height, width)] = (tiled * self.spread).astype(np.int16)[..., None]
+            frame = np.clip(frame.astype(np.int16) + offset, 0, 255).astype(np.uint8)
+        return self.lut[frame[..., 0] >> 3, frame[..., 1] >> 3, frame[..., 2] >> 3]
+
+    def quantize(self, frame):
+        """返回量化后的BGR帧（颜色均来自调色板）"""
+        return self.palette[self.indices(frame)]
+
+    def describe(self):
+        """返回量化配置（写入pack.mcmeta）"""
+        return {
+            "colors": len(self.palette),
+            "mode": self.mode,
+            "dither": self.dither
+        }
+
+
+class FrameCache:
+    """
+    缩放后帧的内存映射缓存
+
+    首次转换时把缩放到目标分辨率的20 TPS帧写入视频旁的.npy文件（附带.json元数据），
+    之后以相同分辨率重新编码（调整粒子尺寸、帧率、隔行等参数）时直接从memmap零拷贝读取，
+    无需再次解码和缩放视频。裁剪区域 crop=(x, y, 宽, 高) 是缓存键的一部分。
+    """
+    version = 1
+
+    def __init__(self, video_path, width, height, crop=None):
+        base = os.path.splitext(video_path)[0]
+        self.video_path = video_path
+        self.width = width
+        self.height = height
+        self.crop = list(crop) if crop else None
+        key = f"{width}x{height}" + (f"_crop{'_'.join(map(str, crop))}" if crop else "")
+        self.data_path = f"{base}.vdcache_{key}.npy"
+        self.meta_path = f"{base}.vdcache_{key}.json"
+        self._writer = None
+        self._capacity = 0
+        self._count = 0
+
+    def source_signature(self):
+        """源视频的签名（大小和修改时间），用于判断缓存是否过期"""
+        stat = os.stat(self.video_path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def load_metadata(self):
+        """读取元数据；缓存不存在或已过期时返回None"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != self.version or meta.get("source") != self.source_signature():
+            return None
+        if meta.get("crop") != self.crop:
+            return None
+        if not os.path.exists(self.data_path):
+            return None
+        return meta
+
+    def open(self):
+        """以只读memmap打开缓存的帧数组 (帧数, 高, 宽, 3)；缓存无效时返回None"""
+        meta = self.load_metadata()
+        if meta is None:
+            return None
+        frames = np.load(self.data_path, mmap_mode='r')
+        return frames[:meta["frames"]]
+
+    def begin(self, estimated_frames):
+        """开始写入缓存（帧数按估计值预分配，稍留余量）"""
+        self._capacity = int(estimated_frames * 1.05) + 20
+        self._count = 0
+        self._writer = np.lib.format.open_memmap(
+            self.data_path + ".tmp", mode='w+', dtype=np.uint8,
+            shape=(self._capacity, self.height, self.width, 3))
+
+    def append(self, frame):
+        """写入一帧；超出预分配容量时放弃本次缓存"""
+        if self._writer is None:
+            return
+        if self._count >= self._capacity:
+            self.abort()
+            return
+        self._writer[self._count] = frame
+        self._count += 1
+
+    def _close_writer(self):
+        writer, self._writer = self._writer, None
+        writer.flush()
+        del writer
+
+    def finish(self):
+        """完成写入并保存元数据"""
+        if self._writer is None:
+            return False
+        self._close_writer()
+        os.replace(self.data_path + ".tmp", self.data_path)
+        meta = {
+            "version": self.version,
+            "source": self.source_signature(),
+            "width": self.width,
+            "height": self.height,
+            "crop": self.crop,
+            "fps": 20,
+            "frames": self._count,
+            "creation_date": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        return True
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        if self._writer is None:
+            return
+        self._close_writer()
+        try:
+            os.remove(self.data_path + ".tmp")
+        except OSError:
+            pass
+
+
+class ThroughputMeter:
+    """
+    转换吞吐量统计：帧/秒、编码MB/秒、已写入字节、预计数据包大小和剩余时间
+
+    速率按最近window秒内的采样计算（滑动窗口），避免开头或个别大帧造成ETA剧烈波动。
+    """
+    def __init__(self, total_frames, window=10.0):
+        self.total_frames = total_frames
+        self.window = window
+        self.start_time = time.time()
+        self.samples = collections.deque()  # (时间, 已处理帧数, 已写入字节)
+        self.samples.append((self.start_time, 0, 0))
+
+    def update(self, frames_done, bytes_written):
+        """记录一次采样并返回当前统计"""
+        now = time.time()
+        self.samples.append((now, frames_done, bytes_written))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        
+        t0, f0, b0 = self.samples[0]
+        span = max(now - t0, 1e-6)
+        fps = (frames_done - f0) / span
+        bytes_per_second = (bytes_written - b0) / span
+        remaining = max(self.total_frames - frames_done, 0)
+        return {
+            "frames": frames_done,
+            "total_frames": self.total_frames,
+            "fps": fps,
+            "mb_per_second": bytes_per_second / (1024 * 1024),
+            "bytes_written": bytes_written,
+            "projected_bytes": int(bytes_written / frames_done * self.total_frames) if frames_done else 0,
+            "eta": remaining / fps if fps > 0 else None,
+            "elapsed": now - self.start_time
+        }
+
+    @staticmethod
+    def format_duration(seconds):
+        """将秒数格式化为 h:mm:ss / m:ss"""
+        if seconds is None:
+            return "--:--"
+        minutes, secs = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+    @staticmethod
+    def format_metrics(metrics):
+        """将统计格式化为一行文本"""
+        return (f"{metrics['fps']:.1f} 帧/秒 | {metrics['mb_per_second']:.2f} MB/秒 | "
+                f"已写入 {metrics['bytes_written'] / (1024 * 1024):.2f} MB | "
+                f"预计总大小 {metrics['projected_bytes'] / (1024 * 1024):.2f} MB | "
+                f"剩余 {ThroughputMeter.format_duration(metrics['eta'])}")
+
+
+class PreflightEstimator:
+    """
+    转换前预估：从视频中抽取少量帧，用所选编码器实际编码（输出写入临时目录），
+    推算整个转换的文件数、数据包大小、每tick命令数峰值和耗时，
+    并可求解满足大小/命令数预算的最大分辨率
+
+    参数:
+        video_path (str): 视频文件路径
+        options (dict): 转换选项（同VideoProcessor）
+        bursts (int): 抽样位置数
+        burst_length (int): 每个位置连续抽取的播放帧数（差量编码器需要相邻帧）
+        max_sample_size (int): 抽样帧保存的最大边长（像素），限制内存占用
+    """
+    def __init__(self, video_path, options, bursts=8, burst_length=4, max_sample_size=1024):
+        self.video_path = video_path
+        self.options = options or {}
+        self.bursts = bursts
+        self.burst_length = burst_length
+        self.max_sample_size = max_sample_size
+        self.target_fps = int(self.options.get("fps", 20))
+        self.frame_ticks = 20 // self.target_fps
+        self.frames = []
+        self.source_size = None
+        self.source_frames = 0
+        self.decoded_frames = 0  # 转换时实际解码的帧数（帧率转换为20FPS后的帧数）
+        self.playback_frames = 0
+        self.read_time = 0.0  # 每个源帧的解码时间（秒）
+        self.sample_scale = 1.0  # 抽样帧相对源视频的缩小比例
+        self.crop = None  # 裁剪区域 (x, y, 宽, 高)，源视频坐标
+
+    def sample(self):
+        """从视频中均匀选取若干位置，每处连续抽取burst_length个播放帧"""
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise RuntimeError("无法打开视频文件")
+        try:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.source_size = (width, height)
+            self.source_frames = max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            source_fps = cap.get(cv2.CAP_PROP_FPS) or 20
+            # 与VideoProcessor.check_and_convert_fps一致：帧率不在有效列表中时先转换为20FPS
+            if source_fps in (20, 40, 60, 120):
+                frame_interval = int(round(source_fps / 20))
+                self.decoded_frames = self.source_frames
+                tick_frames = math.ceil(self.source_frames / frame_interval)
+            else:
+                self.decoded_frames = max(1, math.ceil(self.source_frames / source_fps * 20))
+                tick_frames = self.decoded_frames
+            self.playback_frames = max(1, math.ceil(tick_frames / self.frame_ticks))
+            
+            shrink = min(1.0, self.max_sample_size / max(width, height))
+            self.sample_scale = shrink
+            sample_size = (max(1, int(width * shrink)), max(1, int(height * shrink)))
+            # 相邻播放帧在源视频中的间隔（源帧数，转换帧率时不是整数）
+            stride = source_fps / 20 * self.frame_ticks
+            offsets = {int(round(k * stride)) for k in range(self.burst_length)}
+            span = max(offsets) + 1
+            starts = np.linspace(0, max(0, self.source_frames - span), self.bursts).astype(int)
             
+            self.frames = []
+            reads, read_seconds = 0, 0.0
+            for start in sorted(set(starts.tolist())):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+                for index in range(span):
+                    begin = time.perf_counter()
+                    if index in offsets:
+                        ret, frame = cap.read()
+                    else:
+                        ret, frame = cap.grab(), None
+                    read_seconds += time.perf_counter() - begin
+                    reads += 1
+                    if not ret:
+                        break
+                    if frame is not None:
+                        self.frames.append(cv2.resize(frame, sample_size) if shrink < 1.0 else frame)
+            self.read_time = read_seconds / max(1, reads)
+        finally:
+            cap.release()
+        if not self.frames:
+            raise RuntimeError("无法从视频中读取帧")
+        return len(self.frames)
+
+    def detect_crop(self, threshold=24, coverage=0.01):
+        """
+        检测抽样帧中恒定的黑边（上下黑边或左右黑边）
+
+        参数:
+            threshold (int): 亮度不超过该值视为黑色（0-255）
+            coverage (float): 一行/列中超过该比例的像素在任一抽样帧中不是黑色时视为画面
+
+        返回:
+            tuple: 源视频坐标下的画面区域 (x, y, 宽, 高)；没有黑边时返回None
+        """
+        if not self.frames:
+            self.sample()
+        # 每个像素在所有抽样帧中的最大亮度
+        peak = np.max([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in self.frames], axis=0) > threshold
+        rows = np.flatnonzero(peak.mean(axis=1) > coverage)
+        cols = np.flatnonzero(peak.mean(axis=0) > coverage)
+        if not len(rows) or not len(cols):
+            return None
+        height, width = peak.shape
+        if rows[0] == 0 and cols[0] == 0 and rows[-1] == height - 1 and cols[-1] == width - 1:
+            return None
+        scale = 1 / self.sample_scale
+        source_w, source_h = self.source_size
+        x, y = int(cols[0] * scale), int(rows[0] * scale)
+        return (x, y, min(source_w, int(math.ceil((cols[-1] + 1) * scale))) - x,
+                min(source_h, int(math.ceil((rows[-1] + 1) * scale))) - y)
+
+    def resolve_crop(self):
+        """按选项确定裁剪区域："auto"时自动检测，(x, y, 宽, 高)时直接使用"""
+        crop = self.options.get("crop")
+        self.crop = self.detect_crop() if crop == "auto" else (tuple(crop) if crop else None)
+        return self.crop
+
+    def cropped_frames(self):
+        """返回应用裁剪后的抽样帧"""
+        if not self.frames:
+            self.sample()
+        if not self.crop:
+            return self.frames
+        x, y, w, h = (int(round(v * self.sample_scale)) for v in self.crop)
+        return [frame[y:y + max(1, h), x:x + max(1, w)] for frame in self.frames]
+
+    def estimate(self, screen):
+        """
+        按给定屏幕参数预估输出规模
+        
+        参数:
+            screen (tuple): ((宽, 高), 屏幕尺寸, 粒子尺寸)，同VideoProcessor
+        
+        返回:
+            dict: width, height, frames, files, bytes, peak_commands, mean_commands, seconds
+        """
+        if not self.frames:
+            self.sample()
+            self.resolve_crop()
+        target_ratio, screen_size, particle_size = screen
+        new_width, new_height = VideoProcessor.scaled_size(*(self.crop[2:] if self.crop else self.source_size),
+                                                           target_ratio)
+        name = self.options.get("encoder", "particle")
+        particle = name == ParticleSerializer.name
+        interlace_rows = max(1, int(self.options.get("interlace", 1))) if particle else 1
+        lod_levels = len(self.options.get("lod_distances") or []) if particle else 0
+        tiles = len(VideoProcessor.split_tiles(new_width, new_height, self.options.get("tile_size"))) \
+            if particle and not lod_levels else 0
+        # 帧函数之外每tick执行的命令：分块/LOD的分派行、音频分段切换、schedule或计分板播放器
+        overhead = tiles or lod_levels
+        if int(self.options.get("audio_segment", 0)) > 0:
+            overhead += 2  # stopsound + playsound
+        if self.options.get("player", "schedule") == "scoreboard":
+            depth = math.ceil(math.log2(self.playback_frames)) if self.playback_frames > 1 else 0
+            overhead += 4 + 2 * depth + (3 if self.frame_ticks > 1 else 0)
+        else:
+            overhead += 1
+        
+        sizes, commands = [], []
+        encode_seconds = 0.0
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+            settings = {
+                "options": self.options,
+                "frame_size": (new_width, new_height),
+                "spacing": screen_size / new_width,
+                "particle_size": particle_size,
+                "keyframe_interval": 10 * self.target_fps,
+                "executor": executor,
+                "datapack_dir": os.path.join(temp_dir, "datapack"),
+                "world_dir": os.path.join(temp_dir, "world"),
+                "pack_dir": os.path.join(temp_dir, "pack")
+            }
+            encoder = ENCODERS[name].create(settings)
+            encoder.begin(settings)
+            resized_frames = [cv2.resize(frame, (new_width, new_height)) for frame in self.cropped_frames()]
+            quantizer = None
+            if int(self.options.get("palette_colors", 0)) > 0:
+                quantizer = PaletteQuantizer(self.options["palette_colors"], self.options.get("palette_mode", "kmeans"),
+                                             self.options.get("dither", False))
+                quantizer.fit(resized_frames)
+                if particle:
+                    encoder.set_palette(quantizer.palette)
+            for tick, resized in enumerate(resized_frames):
+                begin = time.perf_counter()
+                if quantizer:
+                    resized = quantizer.quantize(resized)
+                interlace = (interlace_rows, tick % interlace_rows) if interlace_rows > 1 else None
+                data = encoder.encode(resized, tick, interlace)
+                encode_seconds += time.perf_counter() - begin
+                sizes.append(len(data))
+                # 行去重时每个行函数调用还会执行该行的全部粒子命令
+                row_calls = data.count(b' run function vd:rows/')
+                commands.append(data.count(b'\n') + row_calls * new_width + overhead)
+            encoder.finish()
+            # 行去重写出的行函数在帧间共享，按抽样比例线性外推（偏大，作为预算的上限）
+            rows_dir = encoder.rows_ws.root_path if particle and encoder.rows_ws is not None else None
+            row_files, row_bytes = 0, 0
+            if rows_dir:
+                row_files = len(encoder.row_names)
+                row_bytes = sum(os.path.getsize(os.path.join(rows_dir, f"{name}.mcfunction"))
+                                for name in encoder.row_names)
+            # 编码器写出的其他附加文件（地图、结构、图集等）
+            side_files, side_bytes = 0, 0
+            for root, _, files in os.walk(temp_dir):
+                if os.path.abspath(root) == rows_dir:
+                    continue
+                side_files += len(files)
+                side_bytes += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        
+        samples = len(self.frames)
+        frames = self.playback_frames
+        # LOD每一级分辨率减半，总大小约为第0级的 1 + 1/4 + 1/16 ...
+        size_factor = sum(0.25 ** level for level in range(lod_levels)) if lod_levels else 1.0
+        frame_files = frames * (1 + (tiles or lod_levels))
+        control_files = 5  # pack.mcmeta、init、load、del、结束函数
+        if self.options.get("player", "schedule") == "scoreboard":
+            control_files += 10 + max(0, frames - 1)  # 播放器、控制命令和分派树
+        return {
+            "width": new_width,
+            "height": new_height,
+            "frames": frames,
+            "files": frame_files + control_files + math.ceil((side_files + row_files) * frames / samples),
+            "bytes": int(sum(sizes) / samples * frames * size_factor + (side_bytes + row_bytes) * frames / samples),
+            "peak_commands": max(commands),
+            "mean_commands": sum(commands) / samples,
+            "seconds": self.decoded_frames * self.read_time + encode_seconds / samples * frames
+        }
+
+    def solve(self, screen, max_bytes=None, max_commands=None, steps=8, max_doublings=6):
+        """
+        查找满足预算的最大分辨率（保持宽高比），粒子尺寸按比例缩放以保持画面覆盖
+        
+        当前分辨率满足预算时先逐次加倍向上搜索，直到超出预算（或超过源视频分辨率），
+        再在满足与超出之间二分查找
+        
+        返回:
+            tuple: (屏幕参数, 预估结果)；最小分辨率也无法满足预算时返回None
+        """
+        target_ratio, screen_size, particle_size = screen
+        if not self.frames:
+            self.sample()
+            self.resolve_crop()
+        source_size = self.crop[2:] if self.crop else self.source_size
+        
+        def scaled(factor):
+            return ((max(1, round(target_ratio[0] * factor)), max(1, round(target_ratio[1] * factor))),
+                    screen_size, particle_size / factor)
+        
+        def attempt(candidate):
+            """预估候选参数；超过源视频分辨率（放大无意义）或超出预算时返回None"""
+            if VideoProcessor.scaled_size(*source_size, candidate[0])[0] > source_size[0]:
+                return None
+            result = self.estimate(candidate)
+            if max_bytes and result["bytes"] > max_bytes:
+                return None
+            if max_commands and result["peak_commands"] > max_commands:
+                return None
+            return candidate, result
+        
+        best = attempt(screen)
+        if best:
+            # 向上加倍，找到第一个不满足的倍数作为上界
+            lo, hi = 1.0, None
+            for _ in range(max_doublings):
+                found = attempt(scaled(lo * 2))
+                if not found:
+                    hi = lo * 2
+                    break
+                lo, best = lo * 2, found
+            if hi is None:
+                return best
+        else:
+            lo, hi = 0.0, 1.0
+        for _ in range(steps):
+            mid = (lo + hi) / 2
+            found = attempt(scaled(mid))
+            if found:
+                lo, best = mid, found
+            else:
+                hi = mid
+        return best
+
+    @staticmethod
+    def format_estimate(result):
+        """把预估结果格式化为一行文本"""
+        return (f"{result['width']}x{result['height']} | {result['frames']} 帧 | "
+                f"约 {result['files']} 个文件 | 约 {result['bytes'] / (1024 * 1024):.1f} MB | "
+                f"每tick命令 峰值 {result['peak_commands']} / 平均 {result['mean_commands']:.0f} | "
+                f"预计耗时 {ThroughputMeter.format_duration(result['seconds'])}（不含音频提取）")
+
+
+class DatapackSimulator:
+    """
+    离线播放模拟器：解析生成的数据包（目录或zip），沿 schedule 链（或计分板播放器的帧顺序）
+    逐tick统计命令数、粒子数和文件大小，检查超过命令链长度上限、缺失函数和循环等问题，
+    并可把任意tick的粒子画面渲染为PNG（无需启动游戏）
+
+    调用的函数（function / execute ... run function）按全部展开计数，
+    LOD等按条件选择的分支因此给出的是上限；渲染画面时则按给定的玩家距离只选择满足条件的分支
+
+    参数:
+        path (str): 数据包目录、其中的pack.mcmeta或zip文件
+        max_chain_length (int): 每tick命令数上限（游戏规则 maxCommandChainLength）
+    """
+    FUNCTION_PATH = re.compile(r"(?:^|.*/)data/([^/]+)/functions?/(.+)\.mcfunction$")
+    CALL = re.compile(r"(?:^|\brun )function ([\w.:/-]+)")
+    SCHEDULE = re.compile(r"schedule function ([\w.:/-]+) (\d+)([tsd]?)")
+    POSITIONED = re.compile(r"\bpositioned (\S+) (\S+) (\S+)")
+    DISTANCE_CONDITION = re.compile(r"\b(if|unless) entity @a\[distance=\.\.([\d.]+)\]")
+    FRAME_NAME = re.compile(r"vd:(?:s\d+/)?vd(\d+)")
+    DELAY_UNITS = {"": 1, "t": 1, "s": 20, "d": 24000}
+
+    def __init__(self, path, max_chain_length=65536):
+        if os.path.basename(path) == "pack.mcmeta":
+            path = os.path.dirname(path)
+        self.path = path
+        self.max_chain_length = max_chain_length
+        self.archive = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        self.files = {}  # 函数ID -> 文件路径（zip内为条目名）
+        self.summaries = {}
+        self.metadata = {}
+        self._expanded = {}
+
+    def scan(self):
+        """列出数据包中的所有函数"""
+        if self.archive:
+            names = self.archive.namelist()
+        else:
+            names = [os.path.relpath(os.path.join(root, f), self.path).replace(os.sep, '/')
+                     for root, _, files in os.walk(self.path) for f in files]
+        for name in names:
+            match = self.FUNCTION_PATH.fullmatch(name)
+            if match:
+                self.files[f"{match.group(1)}:{match.group(2)}"] = name
+            elif name.endswith("pack.mcmeta"):
+                try:
+                    self.metadata = json.loads(self.read(name)).get("video_metadata", {})
+                except ValueError:
+                    pass
+        return len(self.files)
+
+    def read(self, name):
+        """读取数据包中的文件内容"""
+        if self.archive:
+            return self.archive.read(name).decode('utf-8')
+        with open(os.path.join(self.path, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    @staticmethod
+    def offset(value):
+        """解析相对坐标（~、~.5、~-1.25）"""
+        return float(value[1:] or 0) if value.startswith("~") else 0.0
+
+    def parse(self, function_id):
+        """统计一个函数的命令数、粒子数、大小、调用和调度目标"""
+        text = self.read(self.files[function_id])
+        commands, particles = 0, 0
+        calls, schedules = [], []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            commands += 1
+            if line.startswith("particle "):
+                particles += 1
+                continue
+            match = self.SCHEDULE.match(line)
+            if match:
+                schedules.append((match.group(1), int(match.group(2)) * self.DELAY_UNITS[match.group(3)]))
+                continue
+            match = self.CALL.search(line)
+            if match:
+                calls.append(match.group(1))
+        return {
+            "commands": commands,
+            "particles": particles,
+            "bytes": len(text.encode('utf-8')),
+            "calls": calls,
+            "schedules": schedules
+        }
+
+    def expand(self, function_id, missing):
+        """递归累计函数及其调用的函数的(命令数, 粒子数)"""
+        if function_id in self._expanded:
+            return self._expanded[function_id]
+        summary = self.summaries.get(function_id)
+        if summary is None:
+            missing.add(function_id)
+            return 0, 0
+        self._expanded[function_id] = (0, 0)  # 防止递归调用造成死循环
+        commands, particles = summary["commands"], summary["particles"]
+        for target in summary["calls"]:
+            sub_commands, sub_particles = self.expand(target, missing)
+            commands += sub_commands
+            particles += sub_particles
+        self._expanded[function_id] = (commands, particles)
+        return commands, particles
+
+    def playback_order(self, violations):
+        """返回[(tick, 帧函数ID), ...]：沿schedule链；计分板播放器则按帧编号排列"""
+        load = self.summaries.get("000init:load", {"calls": []})
+        starts = [target for target in load["calls"] if not target.startswith("000init:")]
+        if starts:
+            order, tick, current, visited = [], 0, starts[0], set()
+            while current:
+                if current in visited:
+                    violations.append(f"schedule链在{current}处形成循环")
+                    break
+                if current not in self.summaries:
+                    violations.append(f"schedule链指向不存在的函数: {current}")
+                    break
+                visited.add(current)
+                order.append((tick, current))
+                schedules = self.summaries[current]["schedules"]
+                if len(schedules) > 1:
+                    violations.append(f"{current} 调度了{len(schedules)}个函数，只跟随第一个")
+                current, delay = schedules[0] if schedules else (None, 0)
+                tick += delay
+            return order
+        
+        # 计分板播放器：每frame_ticks刻播放下一帧
+        frame_ticks = 20 // int(self.metadata.get("fps", 20) or 20)
+        frames = sorted((int(m.group(1)), function_id) for function_id in self.summaries
+                        for m in [self.FRAME_NAME.fullmatch(function_id)] if m)
+        return [(number * frame_ticks, function_id) for number, function_id in frames]
+
+    def run(self):
+        """
+        并行解析所有函数并模拟播放
+
+        返回:
+            dict: functions, bytes, frames, ticks (每tick明细列表), peak_commands, peak_tick,
+                  peak_particles, mean_commands, violations
+        """
+        if not self.files:
+            self.scan()
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+            self.summaries = dict(zip(self.files, executor.map(self.parse, self.files)))
+        self._expanded = {}
+        
+        violations = []
+        missing = set()
+        ticks = []
+        for tick, function_id in self.playback_order(violations):
+            commands, particles = self.expand(function_id, missing)
+            ticks.append({
+                "tick": tick,
+                "function": function_id,
+                "commands": commands,
+                "particles": particles,
+                "bytes": self.summaries[function_id]["bytes"]
+            })
+            if commands > self.max_chain_length:
+                violations.append(f"tick {tick} ({function_id}) 执行{commands}条命令，超过上限{self.max_chain_length}")
+        violations.extend(f"调用了不存在的函数: {function_id}" for function_id in sorted(missing))
+        
+        peak = max(ticks, key=lambda item: item["commands"]) if ticks else None
+        return {
+            "functions": len(self.summaries),
+            "bytes": sum(summary["bytes"] for summary in self.summaries.values()),
+            "frames": len(ticks),
+            "ticks": ticks,
+            "peak_commands": peak["commands"] if peak else 0,
+            "peak_tick": peak["tick"] if peak else None,
+            "peak_particles": max((item["particles"] for item in ticks), default=0),
+            "mean_commands": sum(item["commands"] for item in ticks) / len(ticks) if ticks else 0,
+            "violations": violations
+        }
+
+    def collect_particles(self, function_id, dx=0.0, dy=0.0, points=None, depth=0, distance=0.0):
+        """
+        收集函数（及调用的函数）中的粒子：[(x, y, r, g, b), ...]，坐标相对原点
+
+        参数:
+            distance (float): 假设的玩家到原点的距离，只展开距离条件（LOD分支）成立的调用
+        """
+        points = [] if points is None else points
+        if function_id not in self.files or depth > 16:
+            return points
+        for line in self.read(self.files[function_id]).splitlines():
+            tokens = line.split()
+            if len(tokens) >= 8 and tokens[0] == "particle" and tokens[1] in ("dust", "minecraft:dust"):
+                r, g, b = (float(v) for v in tokens[2:5])
+                points.append((dx + self.offset(tokens[6]), dy + self.offset(tokens[7]), r, g, b))
+                continue
+            match = self.CALL.search(line)
+            if match and not line.startswith("schedule") and self.distance_matches(line, distance):
+                position = self.POSITIONED.search(line)
+                offset_x = self.offset(position.group(1)) if position else 0.0
+                offset_y = self.offset(position.group(2)) if position else 0.0
+                self.collect_particles(match.group(1), dx + offset_x, dy + offset_y, points, depth + 1, distance)
+        return points
+
+    @classmethod
+    def distance_matches(cls, line, distance):
+        """命令中的 if/unless entity @a[distance=..D] 条件对距离为distance的玩家是否成立"""
+        for kind, limit in cls.DISTANCE_CONDITION.findall(line):
+            if (distance <= float(limit)) != (kind == "if"):
+                return False
+        return True
+
+    def render_tick(self, tick, output_path, report=None, distance=0.0):
+        """
+        把指定tick的粒子画面渲染为PNG（每个粒子一个像素，只包含该tick输出的粒子）
+
+        参数:
+            distance (float): 玩家到原点的距离，启用LOD时决定渲染哪一级（默认最近一级）
+
+        返回:
+            tuple: 图像尺寸 (宽, 高)
+        """
+        report = report or self.run()
+        entry = next((item for item in report["ticks"] if item["tick"] >= tick), None)
+        if entry is None:
+            raise ValueError(f"tick {tick} 超出播放范围")
+        points = np.array(self.collect_particles(entry["function"], distance=distance),
+                          dtype=np.float64).reshape(-1, 5)
+        if not len(points):
+            raise ValueError(f"tick {entry['tick']} 没有粒子")
+        
+        # 以相邻粒子的最小间距为一个像素
+        def grid(values):
+            unique = np.unique(values.round(4))
+            steps = np.diff(unique)
+            step = steps[steps > 0].min() if (steps > 0).any() else 1.0
+            return np.round((values - unique[0]) / step).astype(int)
+        
+        xs, ys = grid(points[:, 0]), grid(-points[:, 1])
+        image = np.zeros((ys.max() + 1, xs.max() + 1, 3), dtype=np.uint8)
+        image[ys, xs] = np.clip(points[:, [4, 3, 2]] * 255, 0, 255).round().astype(np.uint8)  # RGB -> BGR
+        if not cv2.imwrite(output_path, image):
+            raise RuntimeError(f"无法写入图片: {output_path}")
+        return image.shape[1], image.shape[0]
+
+    @staticmethod
+    def format_report(report, limit=10):
+        """把模拟结果格式化为多行文本"""
+        lines = [
+            f"函数文件: {report['functions']} 个，共 {report['bytes'] / (1024 * 1024):.2f} MB",
+            f"播放帧数: {report['frames']}",
+            f"每tick命令数: 峰值 {report['peak_commands']}（tick {report['peak_tick']}），"
+            f"平均 {report['mean_commands']:.0f}",
+            f"每tick粒子数峰值: {report['peak_particles']}",
+        ]
+        if report["violations"]:
+            lines.append(f"发现 {len(report['violations'])} 个问题:")
+            lines.extend(f"  • {violation}" for violation in report["violations"][:limit])
+            if len(report["violations"]) > limit:
+                lines.append(f"  ……另有 {len(report['violations']) - limit} 个")
+        else:
+            lines.append("未发现问题")
+        return "\n".join(lines)
+
 
 class VideoProcessor(QThread):
     # 定义信号用于更新进度和状态
     progress_updated = pyqtSignal(int, str)  # (进度百分比, 状态消息)
     processing_frame = pyqtSignal(int, int)   # (当前帧, 总帧数)
+    metrics_updated = pyqtSignal(dict)  # 吞吐量统计（见ThroughputMeter.update）
     finished_processing = pyqtSignal(bool, str)  # (成功, 消息)
 
-    def __init__(self, video_path, ogg_path, ws, screen, app, game_dir, world_dir):
+    def __init__(self, video_path, ogg_path, ws, screen, app, game_dir, world_dir, options=None):
         super().__init__()
         self.video_path = video_path
+        self.source_video_path = video_path  # 帧率转换前的原始视频（帧缓存存放在其旁边）
         self.ogg_path = ogg_path
         self.ws = ws  # 世界目录的工作区
         self.screen = screen
@@ -734,14 +2776,44 @@ class VideoProcessor(QThread):
         self.tick_count = 0
         self.temp_dir = None
         self.cleanup_func = None
+        self.options = options or {}  # 输出选项（见VideoConverterApp.collect_options）
+        self.serializer = None  # 使用粒子编码器时与encoder相同（分块/LOD输出需要）
+        self.quantizer = None
+        self.crop = None  # 裁剪区域 (x, y, 宽, 高)，在缩放前应用
+        self.encoder = None
+        self.frame_size = None  # 缩放后的帧尺寸 (宽, 高)
+        self.skipped_files = 0
+        self.bytes_written = 0  # 已编码写入的字节数
+        self.metrics = None  # 最近一次的吞吐量统计
+        self.full_frames = 0  # 隔行模式下因场景切换输出的整帧数
+        self.target_fps = int(self.options.get("fps", 20))  # 播放帧率（20的约数）
+        self.frame_ticks = max(1, 20 // self.target_fps)  # 每帧持续的游戏刻数
+        self.audio_segment_seconds = int(self.options.get("audio_segment", 0))  # 音频分段长度（0表示不分段）
+        self.audio_segments = 0  # 实际生成的音频分段数
+        self.shard_size = int(self.options.get("shard_size", 0))  # 每个分片目录的帧数（0表示不分片）
+        self.frame_workspaces = {}  # 目录 -> 写入帧函数的工作区
 
     def run(self):
+        # 需要在finally中释放的资源（出错或取消时同样释放）
+        frame_cache, cap, executor = None, None, None
+        encoder_finished = False
         try:
+            # 0. 确定裁剪区域（自动检测黑边或使用界面中指定的区域）
+            self.crop = self.resolve_crop()
+            
+            # 0. 帧缓存命中时无需帧率转换和解码
+            frame_cache, cached_frames = None, None
+            if self.options.get("frame_cache", False):
+                frame_cache, cached_frames = self.open_frame_cache()
+            
             # 0. 帧率检查与转换
-            self.progress_updated.emit(0, "正在检查视频帧率...")
-            if not self.check_and_convert_fps():
-                self.finished_processing.emit(False, "视频帧率转换失败")
-                return
+            if cached_frames is not None:
+                self.progress_updated.emit(2, f"使用帧缓存: {os.path.basename(frame_cache.data_path)}")
+            else:
+                self.progress_updated.emit(0, "正在检查视频帧率...")
+                if not self.check_and_convert_fps():
+                    self.finished_processing.emit(False, "视频帧率转换失败")
+                    return
                 
             # 1. 创建数据包结构
             self.progress_updated.emit(0, "正在创建数据包结构...")
@@ -753,7 +2825,7 @@ class VideoProcessor(QThread):
             self.progress_updated.emit(5, "正在提取音频...")
             
             # 获取FFmpeg路径
-            ffmpeg_path = VideoProcessor(video_path=None, ogg_path=None, ws=_ws_, screen=None, app=None, game_dir=None, world_dir=None).find_ffmpeg()
+            ffmpeg_path = self.find_ffmpeg()
             if not ffmpeg_path:
                 self.progress_updated.emit(0, "找不到FFmpeg")
                 self.finished_processing.emit(False, "无法找到FFmpeg")
@@ -772,7 +2844,7 @@ class VideoProcessor(QThread):
             ]
             
             # 创建并启动FFmpeg工作线程
-            self.ffmpeg_worker = FFmpegWorker(command, self.ogg_path)
+            self.ffmpeg_worker = FFmpegWorker(command, self.ogg_path, self.probe_duration(self.video_path))
             
             # 连接信号
             self.ffmpeg_worker.progress.connect(self.handle_ffmpeg_progress)
@@ -794,29 +2866,47 @@ class VideoProcessor(QThread):
                 self.finished_processing.emit(False, "音频提取失败")
                 return
             
-            # 3. 处理视频帧
-            self.progress_updated.emit(25, "正在打开视频文件...")
-            cap = cv2.VideoCapture(self.video_path)
-            if not cap.isOpened():
-                self.finished_processing.emit(False, "无法打开视频文件")
+            # 音频分段，并在资源包中注册各段
+            if not self.split_audio(ffmpeg_path):
+                self.finished_processing.emit(False, "音频分段失败")
                 return
             
-            # 获取视频参数
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            original_fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            self.total_frames = frame_count
-            
-            # 计算缩放比例
+            # 3. 处理视频帧
             target_ratio, screen_size, particle_size = self.screen
-            scale = max(width, height) / (target_ratio[0] if width > height else target_ratio[1])
-            new_width = int(width / scale)
-            new_height = int(height / scale)
+            if cached_frames is not None:
+                self.progress_updated.emit(25, "正在读取帧缓存...")
+                new_width, new_height = frame_cache.width, frame_cache.height
+                frame_count = len(cached_frames)
+                frame_source = cached_frames
+            else:
+                self.progress_updated.emit(25, "正在打开视频文件...")
+                cap = cv2.VideoCapture(self.video_path)
+                if not cap.isOpened():
+                    self.finished_processing.emit(False, "无法打开视频文件")
+                    return
+                
+                # 获取视频参数
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                original_fps = cap.get(cv2.CAP_PROP_FPS)
+                
+                # 计算缩放比例（裁剪后的画面），并按20 TPS采样
+                if self.crop:
+                    width, height = self.crop[2:]
+                new_width, new_height = self.compute_frame_size(width, height)
+                frame_interval = max(1, int(round(original_fps / 20)))
+                frame_count = math.ceil(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) / frame_interval)
+                if frame_cache is not None:
+                    try:
+                        frame_cache.begin(frame_count)
+                    except OSError as e:
+                        self.progress_updated.emit(25, f"无法创建帧缓存: {str(e)}")
+                        frame_cache = None
+                frame_source = self.iter_resized_frames(cap, new_width, new_height, frame_interval, frame_cache)
+            self.total_frames = frame_count
             
-            # 设置新视频帧率
-            target_fps = 20
-            frame_interval = max(1, int(round(original_fps / target_fps)))
+            # 按播放帧率从20 TPS帧中抽帧
+            expected_frames = max(1, math.ceil(frame_count / self.frame_ticks))
             
             # 创建必要的目录结构
             vd_functions_dir = os.path.join(self.datapack_dir, "data", "vd", "functions")
@@ -825,45 +2915,100 @@ class VideoProcessor(QThread):
             
             # 处理每帧
             self.tick_count = 0
-            frame_num = 0
             self.processed_frames = 0
-            s = screen_size / new_width
+            self.frame_size = (new_width, new_height)
+            executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+            encoder_settings = {
+                "options": self.options,
+                "frame_size": self.frame_size,
+                "spacing": screen_size / new_width,
+                "particle_size": particle_size,
+                "keyframe_interval": 10 * self.target_fps,
+                "executor": executor,
+                "datapack_dir": self.datapack_dir,
+                "world_dir": self.world_dir,
+                # 资源包根目录：<pack>/assets/minecraft/sounds/video_music/audio.ogg
+                "pack_dir": os.path.abspath(os.path.join(os.path.dirname(self.ogg_path), *[os.pardir] * 4))
+            }
+            self.encoder = self.create_encoder(encoder_settings)
+            particle = isinstance(self.encoder, ParticleSerializer)
+            self.serializer = self.encoder if particle else None
+            
+            # 调色板量化（缩放后、编码前）
+            self.quantizer = self.create_quantizer(cached_frames, new_width, new_height)
+            if self.quantizer and particle:
+                self.encoder.set_palette(self.quantizer.palette)
+            
+            # 距离LOD：按玩家距离选择分辨率级别（启用时不分块），仅用于粒子输出
+            lod_levels = self.create_lod_levels(new_width, new_height, screen_size, particle_size) if particle else []
+            
+            # 分块输出：每个分块每帧一个函数，并行生成
+            tiles = self.split_tiles(new_width, new_height, self.options.get("tile_size")) \
+                if particle and not lod_levels else []
+            frame_dirs = [name for name, *_ in tiles] + [name for name, *_ in lod_levels]
+            sub_workspaces = {name: Workspace(os.path.join(vd_functions_dir, name)) for name in frame_dirs}
+            
+            # 隔行渲染：第t个tick只输出行号 % N == t % N 的行
+            interlace_rows = max(1, int(self.options.get("interlace", 1))) if particle else 1
+            interlace_adaptive = self.options.get("interlace_adaptive", False)
+            previous_frame = None
+            self.full_frames = 0
             
             # 进度参数（音频提取占5%，帧处理占70%）
-            progress_per_frame = 70.0 / math.ceil(frame_count / frame_interval)
+            progress_per_frame = 70.0 / expected_frames
+            meter = ThroughputMeter(expected_frames)
+            last_report = 0
             
-            while self._is_running:
-                ret, frame = cap.read()
-                if not ret:
+            for frame_index, resized_frame in enumerate(frame_source):
+                if not self._is_running:
                     break
                 
                 # 跳过帧以实现目标FPS
-                if frame_num % frame_interval != 0:
-                    frame_num += 1
+                if frame_index % self.frame_ticks != 0:
                     continue
                 
-                # 调整帧大小
-                resized_frame = cv2.resize(frame, (new_width, new_height))
+                if self.quantizer:
+                    resized_frame = self.quantizer.quantize(resized_frame)
                 
-                # 生成粒子命令
-                txt = f'title @a actionbar \"tick:{self.tick_count}\"\n'
-                for y in range(new_height):
-                    for x in range(new_width):
-                        b, g, r = resized_frame[y, x]
-                        txt += f'particle minecraft:dust {r/255:.3f} {g/255:.3f} {b/255:.3f} {particle_size:.2f} ~{x*s:.3f} ~{-y*s:.3f} ~ 0 0 0 3000 1 force\n'
-                txt += f"schedule function vd:vd{self.tick_count+1} 1"
+                # 选择本帧输出的行
+                interlace = self.select_interlace(resized_frame, previous_frame, self.tick_count,
+                                                  interlace_rows, interlace_adaptive)
+                previous_frame = resized_frame
                 
-                # 创建命令文件
-                self.ws.create_file(f"vd{self.tick_count}.mcfunction", txt)
+                # 音频分段的起始帧播放对应的声音，定期重新同步
+                cue_lines = self.audio_cue_lines(self.tick_count)
+                
+                # 编码本帧并写入命令文件
+                if lod_levels:
+                    lines = self.write_lod_levels(resized_frame, self.tick_count, lod_levels, sub_workspaces, executor, interlace)
+                elif tiles:
+                    lines = self.write_tiles(resized_frame, self.tick_count, tiles, sub_workspaces, executor, interlace)
+                else:
+                    lines = self.encoder.iter_frame(resized_frame, self.tick_count, interlace)
+                if cue_lines:
+                    lines = itertools.chain(cue_lines, lines)
+                if self.options.get("player", "schedule") == "schedule":
+                    delay = "1" if self.frame_ticks == 1 else f"{self.frame_ticks}t"
+                    lines = itertools.chain(lines, [f"schedule function {self.frame_function(self.tick_count + 1)} {delay}"])
+                written, changed = self.frame_workspace(vd_functions_dir, self.tick_count).write_lines(
+                    f"vd{self.tick_count}.mcfunction", lines, skip_unchanged=True)
+                self.bytes_written += written
+                if not changed:
+                    self.skipped_files += 1
                 
                 self.processed_frames += 1
-                if frame_interval > 0:
-                    progress = 25 + int(self.processed_frames * progress_per_frame)
-                    self.progress_updated.emit(progress, "正在生成命令...")
-                    self.processing_frame.emit(self.processed_frames, math.ceil(frame_count / frame_interval))
+                progress = 25 + int(self.processed_frames * progress_per_frame)
+                self.progress_updated.emit(progress, "正在生成命令...")
+                self.processing_frame.emit(self.processed_frames, expected_frames)
+                
+                # 吞吐量统计（每0.5秒报告一次）
+                self.metrics = meter.update(self.processed_frames, self.bytes_written)
+                if time.time() - last_report >= 0.5 or self.processed_frames == expected_frames:
+                    last_report = time.time()
+                    self.metrics_updated.emit(self.metrics)
+                    print(f"[{self.processed_frames}/{expected_frames}] {ThroughputMeter.format_metrics(self.metrics)}")
                 
                 self.tick_count += 1
-                frame_num += 1
                 
                 # 保持UI响应
                 self.app.processEvents()
@@ -872,11 +3017,25 @@ class VideoProcessor(QThread):
                 if not self._is_running:
                     break
             
-            cap.release()
+            if cap is not None:
+                cap.release()
+                cap = None
+            if frame_cache is not None and cached_frames is None and self._is_running:
+                # 只有完整解码的视频才能作为缓存（其他情况在finally中放弃）
+                frame_cache.finish()
+            encoder_finished = True
+            self.encoder.finish()
+            executor.shutdown()
+            executor = None
             
             if not self._is_running:
                 self.finished_processing.emit(False, "操作已取消")
                 return
+            
+            if self.skipped_files:
+                self.progress_updated.emit(94, f"{self.skipped_files}个帧文件内容未变化，已跳过写入")
+            self.remove_stale_frames(vd_functions_dir, self.tick_count, frame_dirs)
+            self.remove_stale_output(encoder_settings)
                 
             # 4. 创建初始化函数
             self.progress_updated.emit(95, "正在创建初始化函数...")
@@ -892,14 +3051,149 @@ class VideoProcessor(QThread):
                 
         except Exception as e:
             self.finished_processing.emit(False, f"处理错误: {str(e)}")
-            import traceback
             traceback.print_exc()
         finally:
+            # 出错时释放视频、放弃未完成的帧缓存（删除.npy.tmp）、结束编码器并关闭线程池
+            if cap is not None:
+                cap.release()
+            if frame_cache is not None:
+                frame_cache.abort()
+            if self.encoder is not None and not encoder_finished:
+                try:
+                    self.encoder.finish()
+                except Exception:
+                    traceback.print_exc()
+            if executor is not None:
+                executor.shutdown()
+            
             # 清理临时文件
             if self.cleanup_func:
                 self.cleanup_func()
                 self.progress_updated.emit(100, "已清理临时文件")
 
+    def split_audio(self, ffmpeg_path):
+        """
+        将提取的audio.ogg按固定时长切分为audio_000.ogg、audio_001.ogg...，
+        并在资源包的sounds.json中注册为video_sound_0、video_sound_1...
+        """
+        audio_dir = os.path.dirname(self.ogg_path)
+        segment_pattern = re.compile(r"audio_(\d+)\.ogg")
+        for name in os.listdir(audio_dir):
+            if segment_pattern.fullmatch(name):
+                os.remove(os.path.join(audio_dir, name))
+        
+        sounds = {
+            "video_sound": {
+                "category": "record",
+                "sounds": [{"name": "video_music/audio", "stream": True}]
+            }
+        }
+        if self.audio_segment_seconds > 0:
+            self.progress_updated.emit(24, f"正在将音频切分为{self.audio_segment_seconds}秒的片段...")
+            command = [
+                ffmpeg_path,
+                '-y',
+                '-i', self.ogg_path,
+                '-f', 'segment',
+                '-segment_time', str(self.audio_segment_seconds),
+                '-acodec', 'libvorbis',
+                '-ar', '44100',
+                os.path.join(audio_dir, "audio_%03d.ogg")
+            ]
+            if not self._run_ffmpeg_command(command, "音频分段", os.path.join(audio_dir, "audio_000.ogg")):
+                return False
+            
+            segments = sorted(int(m.group(1)) for m in map(segment_pattern.fullmatch, os.listdir(audio_dir)) if m)
+            self.audio_segments = len(segments)
+            for index in segments:
+                sounds[f"video_sound_{index}"] = {
+                    "category": "record",
+                    "sounds": [{"name": f"video_music/audio_{index:03d}", "stream": True}]
+                }
+        
+        # sounds.json位于 assets/minecraft，音频位于 assets/minecraft/sounds/video_music
+        sounds_json = os.path.join(os.path.dirname(os.path.dirname(audio_dir)), "sounds.json")
+        with open(sounds_json, 'w', encoding='utf-8') as f:
+            json.dump(sounds, f, indent=2)
+        return True
+
+    def audio_cue_lines(self, frame_index):
+        """音频分段起始帧需要执行的命令（停止上一段并在每个玩家处播放下一段）"""
+        if not self.audio_segments:
+            return []
+        segment_ticks = self.audio_segment_seconds * 20
+        tick = frame_index * self.frame_ticks
+        if tick % segment_ticks != 0 or tick // segment_ticks >= self.audio_segments:
+            return []
+        segment = tick // segment_ticks
+        lines = []
+        if segment > 0:
+            lines.append(f"stopsound @a record minecraft:video_sound_{segment - 1}\n")
+        lines.append(f"execute as @a at @s run playsound minecraft:video_sound_{segment} record @s ~ ~ ~\n")
+        return lines
+
+    def probe_duration(self, video_path):
+        """探测视频时长（秒），无法获取时返回None"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        if fps <= 0 or frame_count <= 0:
+            return None
+        return frame_count / fps
+
+    def compute_frame_size(self, width, height):
+        """根据屏幕参数计算缩放后的帧尺寸"""
+        return self.scaled_size(width, height, self.screen[0])
+
+    @staticmethod
+    def scaled_size(width, height, target_ratio):
+        """按目标宽高（长边对应的像素数）计算缩放后的帧尺寸"""
+        scale = max(width, height) / (target_ratio[0] if width > height else target_ratio[1])
+        return int(width / scale), int(height / scale)
+
+    def open_frame_cache(self):
+        """
+        打开原始视频对应分辨率的帧缓存
+        
+        返回:
+            tuple: (FrameCache, 帧数组或None)；帧数组为None时需要解码视频并写入缓存
+        """
+        cap = cv2.VideoCapture(self.source_video_path)
+        if not cap.isOpened():
+            return None, None
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        
+        if self.crop:
+            width, height = self.crop[2:]
+        frame_cache = FrameCache(self.source_video_path, *self.compute_frame_size(width, height), self.crop)
+        try:
+            return frame_cache, frame_cache.open()
+        except (OSError, ValueError) as e:
+            self.progress_updated.emit(1, f"帧缓存无法读取，将重新解码: {str(e)}")
+            return frame_cache, None
+
+    def iter_resized_frames(self, cap, new_width, new_height, frame_interval, frame_cache=None):
+        """按20 TPS解码并缩放视频帧，同时写入帧缓存"""
+        frame_num = 0
+        while self._is_running:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_num % frame_interval == 0:
+                if self.crop:
+                    x, y, w, h = self.crop
+                    frame = frame[y:y + h, x:x + w]
+                resized_frame = cv2.resize(frame, (new_width, new_height))
+                if frame_cache is not None:
+                    frame_cache.append(resized_frame)
+                yield resized_frame
+            frame_num += 1
+
     def check_and_convert_fps(self):
         """检查帧率并转换到20FPS"""
         try:
@@ -987,7 +3281,9 @@ class VideoProcessor(QThread):
                 output_path
             ]
             
-            return self._run_ffmpeg_command(command, "简单帧率转换")
+            # 流复制时-r不一定改变实际帧率，需检查输出
+            return (self._run_ffmpeg_command(command, "简单帧率转换", output_path) and
+                    self.verify_fps(output_path, fps))
         except Exception as e:
             print(1, f"简单转换失败: {str(e)}")
             return False
@@ -1008,11 +3304,22 @@ class VideoProcessor(QThread):
                 output_path
             ]
             
-            return self._run_ffmpeg_command(command, "过滤器帧率转换")
+            return (self._run_ffmpeg_command(command, "过滤器帧率转换", output_path) and
+                    self.verify_fps(output_path, fps))
         except Exception as e:
             print(1, f"过滤器转换失败: {str(e)}")
             return False
 
+    def verify_fps(self, video_path, fps):
+        """检查转换后的视频帧率是否为目标帧率"""
+        cap = cv2.VideoCapture(video_path)
+        actual = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+        cap.release()
+        if abs(actual - fps) > 0.01:
+            self.progress_updated.emit(1, f"输出帧率为{actual:.2f}，不是{fps}")
+            return False
+        return True
+
     def _try_full_reencode_fps_conversion(self, ffmpeg_path, input_path, output_path, fps):
         """使用完全重编码方法转换帧率"""
         try:
@@ -1043,8 +3350,12 @@ class VideoProcessor(QThread):
         cmd_str = ' '.join(command)
         self.progress_updated.emit(1, f"FFmpeg命令: {cmd_str}")
         
+        # 使用机器可读的进度输出，只保留有限的日志行用于报错
+        command = FFmpegProgress.command_with_progress(command)
+        parser = FFmpegProgress(self.probe_duration(command[command.index('-i') + 1]))
+        
         # 创建日志文件 - 使用UTF-8编码
-        log_path = os.path.join(self.temp_dir, "ffmpeg_log.txt")
+        log_path = os.path.join(self.temp_dir or tempfile.gettempdir(), "ffmpeg_log.txt")
         
         try:
             # 跨平台的FFmpeg执行方式
@@ -1065,7 +3376,6 @@ class VideoProcessor(QThread):
                 )
                 
                 # 读取输出并实时更新状态
-                output_lines = []
                 while True:
                     # 使用二进制模式读取一行
                     raw_line = process.stdout.readline()
@@ -1083,14 +3393,12 @@ class VideoProcessor(QThread):
                             # 如果都失败，使用占位符
                             line = "[无法解码的输出行]"
                     
-                    output_lines.append(line)
                     log_file.write(line + "\n")
-                    log_file.flush()
                     
-                    # 定期更新状态
-                    if len(output_lines) % 10 == 0:
-                        status = f"{method_name}中... 已读取{len(output_lines)}行"
-                        self.progress_updated.emit(1, status)
+                    # 每个进度块结束时更新状态
+                    if parser.feed(line):
+                        log_file.flush()
+                        self.progress_updated.emit(1, parser.describe(method_name))
                     
                     # 检查是否取消
                     if not self._is_running:
@@ -1103,10 +3411,10 @@ class VideoProcessor(QThread):
             
             if return_code != 0:
                 # 收集错误信息 - 使用安全的字符串处理
-                error_output = ''.join(output_lines[-200:])  # 取最后200行
+                error_output = parser.tail(20)
                 
                 # 创建安全的错误消息（避免编码问题）
-                safe_error = self.make_safe_string(f"{method_name}失败，错误码: {return_code}\n{error_output[:500]}")
+                safe_error = self.make_safe_string(f"{method_name}失败，错误码: {return_code}\n{error_output[-500:]}")
                 self.progress_updated.emit(1, safe_error)
                 
                 safe_log_path = self.make_safe_string(f"完整日志: {log_path}")
@@ -1222,6 +3530,8 @@ class VideoProcessor(QThread):
         try:
             # 创建数据包根目录
             self.datapack_dir = os.path.join(self.world_dir, "datapacks", "video_play")
+            if self.options.get("clean_output", False):
+                self.discard_old_datapack()
             ws_datapack = Workspace(self.datapack_dir)
             ws_datapack.create_dir("")
             
@@ -1248,39 +3558,450 @@ class VideoProcessor(QThread):
             print(f"创建数据包结构失败: {str(e)}")
             return False
             
+    def discard_old_datapack(self):
+        """将旧数据包重命名后在后台删除，不阻塞新的转换"""
+        ws_world = Workspace(self.world_dir)
+        trash_prefix = ".video_play_old_"
+        
+        # 清理之前未删除完的旧数据包
+        for name in os.listdir(self.world_dir):
+            if name.startswith(trash_prefix):
+                threading.Thread(target=shutil.rmtree, args=(os.path.join(self.world_dir, name), True),
+                                 daemon=True).start()
+        
+        trash_path = os.path.join(self.world_dir, f"{trash_prefix}{int(time.time() * 1000)}")
+        ws_world.delete_in_background(os.path.join("datapacks", "video_play"), trash_path)
+    
+    @staticmethod
+    def split_tiles(width, height, tile_size):
+        """
+        将屏幕划分为分块
+        
+        返回:
+            list: [(分块名, x0, y0, x1, y1), ...]；tile_size为空时返回空列表
+        """
+        if not tile_size:
+            return []
+        tile_w, tile_h = tile_size
+        tiles = []
+        for row, y0 in enumerate(range(0, height, tile_h)):
+            for col, x0 in enumerate(range(0, width, tile_w)):
+                tiles.append((f"tile_{col}_{row}", x0, y0, min(x0 + tile_w, width), min(y0 + tile_h, height)))
+        return tiles
+    
+    def select_interlace(self, frame, previous_frame, tick, rows, adaptive, cut_threshold=30.0):
+        """
+        选择本帧的隔行参数
+        
+        参数:
+            rows (int): 隔行数N（1表示不隔行）
+            adaptive (bool): 运动自适应，画面与上一帧差异过大（场景切换）时输出整帧
+            cut_threshold (float): 判定场景切换的平均像素差（0-255）
+        
+        返回:
+            tuple | None: (N, 相位)，None表示输出整帧
+        """
+        if rows <= 1:
+            return None
+        if adaptive and (previous_frame is None or
+                         float(np.mean(cv2.absdiff(frame, previous_frame))) > cut_threshold):
+            self.full_frames += 1
+            return None
+        return (rows, tick % rows)
+    
+    def write_tiles(self, frame, tick, tiles, workspaces, executor, interlace=None):
+        """
+        并行生成并写入一帧的所有分块函数
+        
+        返回:
+            list: 该帧主函数的命令（依次调用各分块函数）
+        """
+        def write_tile(name, x0, y0, x1, y1):
+            lines = self.serializer.iter_pixels(frame[y0:y1, x0:x1], x0, y0, interlace)
+            ws = self.frame_workspace(workspaces[name].root_path, tick)
+            return ws.write_lines(f"vd{tick}.mcfunction", lines, skip_unchanged=True)
+        
+        futures = [executor.submit(write_tile, *tile) for tile in tiles]
+        for future in futures:
+            written, changed = future.result()
+            self.bytes_written += written
+            if not changed:
+                self.skipped_files += 1
+        
+        lines = [self.serializer.actionbar_line(tick)] if self.serializer.actionbar else []
+        lines.extend(f"function {self.frame_function(tick, f'{name}/')}\n" for name, *_ in tiles)
+        return lines
+    
+    def resolve_crop(self):
+        """确定裁剪区域；自动检测时抽样原始视频，检测失败则不裁剪"""
+        crop = self.options.get("crop")
+        if not crop:
+            return None
+        if crop != "auto":
+            # 手动指定的区域限制在视频画面内
+            cap = cv2.VideoCapture(self.source_video_path)
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            cap.release()
+            x, y, w, h = crop
+            if not width or not height:
+                return tuple(crop)
+            x, y = min(x, width - 1), min(y, height - 1)
+            return x, y, max(1, min(w, width - x)), max(1, min(h, height - y))
+        self.progress_updated.emit(0, "正在检测黑边...")
+        try:
+            estimator = PreflightEstimator(self.source_video_path, self.options)
+            crop = estimator.detect_crop()
+        except Exception as e:
+            self.progress_updated.emit(0, f"黑边检测失败，将不裁剪: {str(e)}")
+            return None
+        if crop:
+            self.progress_updated.emit(1, "检测到黑边，裁剪为 {2}x{3}（偏移 {0},{1}）".format(*crop))
+        return crop
+    
+    def create_quantizer(self, cached_frames, width, height):
+        """按选项创建调色板量化器（k-means模式下从视频中抽样求调色板）；未启用时返回None"""
+        colors = int(self.options.get("palette_colors", 0))
+        if colors <= 0:
+            return None
+        quantizer = PaletteQuantizer(colors, self.options.get("palette_mode", "kmeans"),
+                                     self.options.get("dither", False))
+        if quantizer.mode == "kmeans":
+            self.progress_updated.emit(25, f"正在计算{colors}色调色板...")
+            if cached_frames is not None:
+                picks = np.linspace(0, len(cached_frames) - 1, min(32, len(cached_frames))).astype(int)
+                samples = [cached_frames[i] for i in picks]
+            else:
+                estimator = PreflightEstimator(self.video_path, self.options)
+                estimator.sample()
+                estimator.crop = self.crop
+                samples = [cv2.resize(frame, (width, height)) for frame in estimator.cropped_frames()]
+            quantizer.fit(samples)
+        return quantizer
+    
+    def create_encoder(self, settings):
+        """根据选项从ENCODERS中创建帧编码器并开始编码"""
+        name = self.options.get("encoder", "particle")
+        encoder_class = ENCODERS.get(name)
+        if encoder_class is None:
+            raise ValueError(f"未知的编码器: {name}")
+        encoder = encoder_class.create(settings)
+        encoder.begin(settings)
+        return encoder
+    
+    def remove_stale_output(self, settings):
+        """让每个登记的编码器（无论本次是否使用）删除之前转换留下、本次不再使用的输出文件"""
+        for encoder_class in ENCODERS.values():
+            active = self.encoder if type(self.encoder) is encoder_class else None
+            removed = encoder_class.remove_stale_output(settings, active)
+            if removed:
+                self.progress_updated.emit(95, f"已删除{removed}个过期的{encoder_class.name}编码器输出文件")
+    
+    def create_lod_levels(self, width, height, screen_size, particle_size):
+        """
+        创建距离LOD级别：第k级分辨率为原来的1/2^k，粒子间距和尺寸相应放大
+        
+        返回:
+            list: [(目录名, 最大距离, 序列化器, (宽, 高)), ...]；未启用时返回空列表
+        """
+        levels = []
+        for level, distance in enumerate(self.options.get("lod_distances") or []):
+            factor = 2 ** level
+            size = (max(1, width // factor), max(1, height // factor))
+            serializer = ParticleSerializer(
+                particle_size * factor, screen_size / size[0],
+                compact=self.options.get("compact", False),
+                actionbar=False,
+                force=self.options.get("force", True))
+            if self.quantizer:
+                serializer.set_palette(self.quantizer.palette)
+            levels.append((f"lod{level}", distance, serializer, size))
+        return levels
+    
+    def write_lod_levels(self, frame, tick, lod_levels, workspaces, executor, interlace=None):
+        """
+        并行生成并写入一帧的所有LOD级别函数
+        
+        返回:
+            list: 该帧主函数的命令（按最近玩家的距离选择一个级别，范围内无玩家时不输出）
+        """
+        def write_level(name, distance, serializer, size):
+            level_frame = frame if size == (frame.shape[1], frame.shape[0]) else \
+                cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            if self.quantizer and level_frame is not frame:
+                # 缩小时的区域平均会产生调色板以外的颜色
+                level_frame = self.quantizer.quantize(level_frame)
+            lines = serializer.iter_pixels(level_frame, interlace=interlace)
+            ws = self.frame_workspace(workspaces[name].root_path, tick)
+            return ws.write_lines(f"vd{tick}.mcfunction", lines, skip_unchanged=True)
+        
+        futures = [executor.submit(write_level, *level) for level in lod_levels]
+        for future in futures:
+            written, changed = future.result()
+            self.bytes_written += written
+            if not changed:
+                self.skipped_files += 1
+        
+        # 函数在原点（盔甲架/世界出生点）执行，distance即到原点的距离
+        lines = [self.serializer.actionbar_line(tick)] if self.serializer.actionbar else []
+        previous_distance = None
+        for name, distance, _, _ in lod_levels:
+            condition = f"unless entity @a[distance=..{previous_distance}] " if previous_distance else ""
+            lines.append(f"execute {condition}if entity @a[distance=..{distance}] run function {self.frame_function(tick, f'{name}/')}\n")
+            previous_distance = distance
+        return lines
+    
+    def shard_name(self, tick):
+        """第tick帧所在的分片目录名（不分片时为None）"""
+        if not self.shard_size:
+            return None
+        return f"s{tick // self.shard_size:03d}"
+    
+    def frame_function(self, tick, prefix=""):
+        """
+        第tick帧函数的资源位置（所有schedule/load/结束/分派树引用都经过这里）
+        
+        参数:
+            prefix (str): vd命名空间下的子目录（如分块目录"tile_0_0/"）
+        
+        返回:
+            str: 如 "vd:vd12345"，分片时为 "vd:s012/vd12345"
+        """
+        shard = self.shard_name(tick)
+        return f"vd:{prefix}{shard}/vd{tick}" if shard else f"vd:{prefix}vd{tick}"
+    
+    def frame_workspace(self, root_dir, tick):
+        """返回写入第tick帧函数的工作区（分片时为对应的分片目录，按目录缓存）"""
+        shard = self.shard_name(tick)
+        path = os.path.join(root_dir, shard) if shard else root_dir
+        ws = self.frame_workspaces.get(path)
+        if ws is None:
+            ws = self.frame_workspaces[path] = Workspace(path)
+        return ws
+    
+    def remove_stale_frames(self, vd_dir, tick_count, frame_dirs=()):
+        """
+        删除上次生成但超出本次tick_count的帧文件（vd{tick_count}为结束函数）、
+        分片设置改变后位置不再正确的帧文件，以及不再使用的分块/LOD目录
+        """
+        removed = 0
+        frame_pattern = re.compile(r"vd(\d+)\.mcfunction")
+        shard_pattern = re.compile(r"s\d+")
+        
+        def clean_files(directory, last, shard):
+            nonlocal removed
+            for entry in list(os.scandir(directory)):
+                match = frame_pattern.fullmatch(entry.name)
+                if match and (int(match.group(1)) > last or self.shard_name(int(match.group(1))) != shard):
+                    os.remove(entry.path)
+                    removed += 1
+        
+        def clean(directory, last):
+            clean_files(directory, last, None)
+            for entry in list(os.scandir(directory)):
+                if entry.is_dir() and shard_pattern.fullmatch(entry.name):
+                    clean_files(entry.path, last, entry.name)
+                    if not any(os.scandir(entry.path)):
+                        os.rmdir(entry.path)
+        
+        clean(vd_dir, tick_count)
+        for entry in list(os.scandir(vd_dir)):
+            if entry.is_dir() and re.fullmatch(r"tile_\d+_\d+|lod\d+", entry.name):
+                if entry.name not in frame_dirs:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    clean(entry.path, tick_count - 1)
+        if removed:
+            self.progress_updated.emit(95, f"已删除{removed}个过期的帧文件")
+        return removed
+    
     def create_init_functions(self, tick_count):
         """创建初始化函数"""
         try:
             init_dir = os.path.join(self.datapack_dir, "data", "000init", "functions")
             ws_init = Workspace(init_dir)
+            scoreboard_player = self.options.get("player", "schedule") == "scoreboard"
             
             # 创建init.mcfunction
             init_content = (
                 'say initizing\nkill @e[type=armor_stand,tag=origin]\nsummon minecraft:armor_stand ~ ~ ~ {Invisible:0b,Tags:[\'origin\'],Silent:1b,NoGravity:1b,CustomName:"{\\"text\\":\\"Origin\\"}",CustomNameVisible:1b,Marker:1b,Invulnerable:1b,NoBasePlate:1b,Small:1b,NoAI:1b,DisabledSlots:0}'
             )
+            if self.encoder and self.frame_size:
+                setup_content = ''.join(
+                    'execute at @e[tag=origin,limit=1] run ' + line
+                    for line in self.encoder.setup_lines(*self.frame_size)).rstrip('\n')
+                if setup_content:
+                    init_content += '\n' + setup_content
+            if scoreboard_player:
+                init_content += (
+                    '\nscoreboard objectives add vd_player dummy'
+                    '\nscoreboard players set #playing vd_player 0'
+                    '\nscoreboard players set #frame vd_player 0'
+                    '\nscoreboard players set #sub vd_player 0'
+                )
             ws_init.create_file("init.mcfunction", init_content)
             
-            # 创建load.mcfunction
-            load_content = (
-                'say loading\nexecute as @e[tag=origin,limit=1] at @s run setworldspawn ~ ~ ~\nplaysound minecraft:video_sound record @a ~ ~ ~\nexecute as @e[tag=origin,limit=1] at @s run function vd:vd0\n'
-            )
+            # 创建load.mcfunction（音频分段时由各段起始帧播放声音）
+            sound_content = '' if self.audio_segments else 'playsound minecraft:video_sound record @a ~ ~ ~\n'
+            if scoreboard_player:
+                load_content = (
+                    'say loading\nexecute as @e[tag=origin,limit=1] at @s run setworldspawn ~ ~ ~\n' + sound_content +
+                    'scoreboard players set #frame vd_player 0\nscoreboard players set #sub vd_player 0\n'
+                    'scoreboard players set #playing vd_player 1\n'
+                )
+            else:
+                load_content = (
+                    'say loading\nexecute as @e[tag=origin,limit=1] at @s run setworldspawn ~ ~ ~\n' + sound_content +
+                    f'execute as @e[tag=origin,limit=1] at @s run function {self.frame_function(0)}\n'
+                )
             ws_init.create_file("load.mcfunction", load_content)
             
             del_content = (
                 'kill @e[type=armor_stand,tag=origin]'
             )
+            if self.encoder and self.frame_size:
+                del_content = ''.join(
+                    'execute at @e[tag=origin,limit=1] run ' + line
+                    for line in self.encoder.cleanup_lines(*self.frame_size)) + del_content
             ws_init.create_file("del.mcfunction", del_content)
             
-            # 在vd命名空间中创建结束函数
+            # 在vd命名空间中创建结束函数（最后一帧调度的就是vd{tick_count}）
             vd_dir = os.path.join(self.datapack_dir, "data", "vd", "functions")
             ws_vd = Workspace(vd_dir)
             end_content = "# 视频结束\nsay 视频播放完成！"
-            ws_vd.create_file(f"vd{self.tick_count+1}.mcfunction", end_content)
+            self.frame_workspace(vd_dir, tick_count).create_file(f"vd{tick_count}.mcfunction", end_content)
+            
+            if scoreboard_player:
+                self.create_scoreboard_player(ws_init, ws_vd, tick_count)
+            else:
+                self.remove_scoreboard_player(ws_init, ws_vd)
             
             return True
         except Exception as e:
             print(f"创建初始化函数失败: {str(e)}")
             return False
+
+    def create_scoreboard_player(self, ws_init, ws_vd, tick_count):
+        """
+        创建计分板驱动的播放器
+        
+        每帧由tick函数将#frame加一（帧率低于20时用#sub计数，每frame_ticks刻前进一帧），
+        并通过二分查找树（execute if score ... matches）分派到当前帧的函数，
+        分派开销为O(log N)，同时支持暂停、跳转和停止。
+        """
+        # 每个游戏刻执行的函数
+        tags_dir = os.path.join(self.datapack_dir, "data", "minecraft", "tags", "functions")
+        ws_tags = Workspace(tags_dir)
+        ws_tags.create_file("tick.json", json.dumps({"values": ["vd:player/tick"]}, indent=2))
+        
+        ws_vd.cd("player")
+        ws_vd.create_file("tick.mcfunction",
+                          "execute if score #playing vd_player matches 1 run function vd:player/step")
+        advance_content = (
+            f"execute as @e[tag=origin,limit=1] at @s run function {self.dispatch_node(0, tick_count - 1)}\n"
+            "scoreboard players add #frame vd_player 1\n"
+            f"execute if score #frame vd_player matches {tick_count}.. run function vd:player/end"
+        )
+        if self.frame_ticks == 1:
+            ws_vd.create_file("step.mcfunction", advance_content)
+        else:
+            ws_vd.create_file("advance.mcfunction", advance_content)
+            ws_vd.create_file("step.mcfunction", (
+                "execute if score #sub vd_player matches 0 run function vd:player/advance\n"
+                "scoreboard players add #sub vd_player 1\n"
+                f"execute if score #sub vd_player matches {self.frame_ticks}.. run scoreboard players set #sub vd_player 0"
+            ))
+        ws_vd.create_file("end.mcfunction", (
+            "scoreboard players set #playing vd_player 0\n"
+            "scoreboard players set #frame vd_player 0\n"
+            "scoreboard players set #sub vd_player 0\n"
+            f"function {self.frame_function(tick_count)}"
+        ))
+        ws_vd.return_to_root()
+        
+        # 二分查找分派树
+        ws_vd.delete("tree")
+        ws_vd.cd("tree")
+        pending = [(0, tick_count - 1)] if tick_count > 1 else []
+        while pending:
+            lo, hi = pending.pop()
+            mid = (lo + hi) // 2
+            lines = []
+            for child_lo, child_hi in ((lo, mid), (mid + 1, hi)):
+                lines.append(f"execute if score #frame vd_player matches {child_lo}..{child_hi} "
+                             f"run function {self.dispatch_node(child_lo, child_hi)}")
+                if child_lo < child_hi:
+                    pending.append((child_lo, child_hi))
+            ws_vd.create_file(f"{lo}_{hi}.mcfunction", "\n".join(lines))
+        ws_vd.return_to_root()
+        
+        # 恢复声音：音频分段时从当前帧所在分段的开头播放（下一分段起重新同步），
+        # 未分段的音频无法从中间继续播放，只提示玩家
+        if self.audio_segments:
+            segment_frames = self.audio_segment_seconds * 20 // self.frame_ticks
+            sound_lines = [
+                "stopsound @a record",
+                "scoreboard players operation #segment vd_player = #frame vd_player",
+                f"scoreboard players set #segment_frames vd_player {segment_frames}",
+                "scoreboard players operation #segment vd_player /= #segment_frames vd_player"
+            ]
+            sound_lines.extend(
+                f"execute if score #segment vd_player matches {segment} as @a at @s "
+                f"run playsound minecraft:video_sound_{segment} record @s ~ ~ ~"
+                for segment in range(self.audio_segments))
+        else:
+            sound_lines = ['tellraw @a {"text":"未启用音频分段，暂停或跳转后无法恢复声音","color":"yellow"}']
+        ws_vd.cd("player")
+        ws_vd.create_file("sound.mcfunction", "\n".join(sound_lines))
+        ws_vd.return_to_root()
+        
+        # 控制命令
+        seek_step = 10 * self.target_fps  # 10秒
+        ws_init.create_file("pause.mcfunction", (
+            "scoreboard players set #playing vd_player 0\n" +
+            self.stop_sound_command()
+        ))
+        ws_init.create_file("resume.mcfunction", (
+            "scoreboard players set #playing vd_player 1\n"
+            "function vd:player/sound"
+        ))
+        ws_init.create_file("stop.mcfunction", (
+            "scoreboard players set #playing vd_player 0\n"
+            "scoreboard players set #frame vd_player 0\n"
+            "scoreboard players set #sub vd_player 0\n" +
+            self.stop_sound_command()
+        ))
+        ws_init.create_file("forward.mcfunction", (
+            f"scoreboard players add #frame vd_player {seek_step}\n"
+            "execute if score #playing vd_player matches 1 run function vd:player/sound"
+        ))
+        ws_init.create_file("rewind.mcfunction", (
+            f"scoreboard players remove #frame vd_player {seek_step}\n"
+            "execute if score #frame vd_player matches ..-1 run scoreboard players set #frame vd_player 0\n"
+            "execute if score #playing vd_player matches 1 run function vd:player/sound"
+        ))
+
+    def stop_sound_command(self):
+        """停止视频声音的命令（分段时停止所有唱片类声音）"""
+        if self.audio_segments:
+            return "stopsound @a record"
+        return "stopsound @a record minecraft:video_sound"
+
+    def dispatch_node(self, lo, hi):
+        """分派树中覆盖[lo, hi]帧的函数名"""
+        if lo == hi:
+            return self.frame_function(lo)
+        return f"vd:tree/{lo}_{hi}"
+
+    def remove_scoreboard_player(self, ws_init, ws_vd):
+        """移除之前生成的计分板播放器及其控制命令（schedule模式下不再需要）"""
+        tick_tag = os.path.join(self.datapack_dir, "data", "minecraft", "tags", "functions", "tick.json")
+        if os.path.exists(tick_tag):
+            os.remove(tick_tag)
+        ws_vd.delete("player")
+        ws_vd.delete("tree")
+        for name in ("pause", "resume", "stop", "forward", "rewind"):
+            ws_init.delete(f"{name}.mcfunction")
             
     def create_datapack_description(self):
         """创建完整的数据包描述文件"""
@@ -1293,10 +4014,23 @@ class VideoProcessor(QThread):
                 "video_metadata": {
                     "original_file": os.path.basename(self.video_path),
                     "frames": self.processed_frames,
-                    "ticks": self.tick_count,
+                    "ticks": self.tick_count * self.frame_ticks,
                     "screen_width": self.screen[0][0],
                     "screen_height": self.screen[0][1],
                     "screen_size": self.screen[1],
+                    "serializer": self.serializer.describe() if self.serializer else None,
+                    "encoder": dict(self.encoder.describe(), name=self.encoder.name) if self.encoder else None,
+                    "player": self.options.get("player", "schedule"),
+                    "fps": self.target_fps,
+                    "audio_segment": self.audio_segment_seconds,
+                    "audio_segments": self.audio_segments,
+                    "shard_size": self.shard_size,
+                    "tile_size": self.options.get("tile_size"),
+                    "lod_distances": self.options.get("lod_distances"),
+                    "interlace": self.options.get("interlace", 1),
+                    "interlace_adaptive": self.options.get("interlace_adaptive", False),
+                    "palette": self.quantizer.describe() if self.quantizer else None,
+                    "crop": list(self.crop) if self.crop else None,
                     "creation_date": time.strftime("%Y-%m-%d %H:%M:%S")
                 }
             }
@@ -1400,11 +4134,39 @@ class VideoProcessor(QThread):
             self.ffmpeg_worker.cancel()
 
 
+class PreflightWorker(QThread):
+    """在后台线程中抽样预估（解码和编码抽样帧可能需要数秒），避免阻塞界面"""
+    estimate_ready = pyqtSignal(object)  # estimate()的结果；autotune时为solve()的结果（可能为None）
+    estimate_failed = pyqtSignal(str)  # 错误消息
+
+    def __init__(self, video_path, options, screen, autotune=False, max_bytes=None, max_commands=None):
+        super().__init__()
+        self.video_path = video_path
+        self.options = options
+        self.screen = screen
+        self.autotune = autotune
+        self.max_bytes = max_bytes
+        self.max_commands = max_commands
+
+    def run(self):
+        try:
+            estimator = PreflightEstimator(self.video_path, self.options)
+            if self.autotune:
+                result = estimator.solve(self.screen, self.max_bytes, self.max_commands)
+            else:
+                result = estimator.estimate(self.screen)
+        except Exception as e:
+            traceback.print_exc()
+            self.estimate_failed.emit(str(e))
+            return
+        self.estimate_ready.emit(result)
+
+
 class VideoConverterApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Minecraft 视频转换工具（由@boring_xia制作，使用制作视频需标注原作者）")
-        self.setGeometry(100, 100, 800, 650)
+        self.setGeometry(100, 100, 800, 880)
         self.video_path = None
         self.target_game_dir = None
         self.target_world_dir = None
@@ -1413,7 +4175,9 @@ class VideoConverterApp(QMainWindow):
         self.screen_size_input = None
         self.particle_size_input = None
         self.processing_thread = None
+        self.preflight_thread = None
         self.elapsed_timer = None
+        self.last_metrics = None
         
         icon_path = self.get_icon_path()
         if icon_path and os.path.exists(icon_path):
@@ -1438,8 +4202,9 @@ class VideoConverterApp(QMainWindow):
             paths_to_try.insert(0, os.path.join(base_path, "resources", "app_icon.ico"))
         
         for path in paths_to_try:
+            path = _ws_.resolve(path)
             if os.path.exists(path):
-                return os.path.abspath(path)
+                return path
         
         return None
     
@@ -1524,8 +4289,147 @@ class VideoConverterApp(QMainWindow):
         
         screen_layout.addLayout(form_layout)
         
+        # 输出选项区
+        options_group = QGroupBox("4. 输出选项")
+        options_group_layout = QVBoxLayout(options_group)
+        options_group_layout.setContentsMargins(15, 15, 15, 15)
+        options_layout = QHBoxLayout()
+        options_group_layout.addLayout(options_layout)
+        options_form = QFormLayout()
+        options_form.setVerticalSpacing(10)
+        options_group_layout.addLayout(options_form)
+        
+        self.compact_checkbox = QCheckBox("紧凑命令格式")
+        self.compact_checkbox.setToolTip("使用最短数值格式并省略默认参数，减小数据包体积")
+        options_layout.addWidget(self.compact_checkbox)
+        
+        self.actionbar_checkbox = QCheckBox("显示tick标题")
+        self.actionbar_checkbox.setChecked(True)
+        options_layout.addWidget(self.actionbar_checkbox)
+        
+        self.force_checkbox = QCheckBox("强制显示粒子(force)")
+        self.force_checkbox.setChecked(True)
+        options_layout.addWidget(self.force_checkbox)
+        
+        self.scoreboard_checkbox = QCheckBox("计分板播放器")
+        self.scoreboard_checkbox.setToolTip("使用计分板和分派树播放，支持暂停、跳转和停止")
+        options_layout.addWidget(self.scoreboard_checkbox)
+        
+        self.clean_output_checkbox = QCheckBox("全新生成")
+        self.clean_output_checkbox.setToolTip("在后台删除旧数据包后重新生成；不勾选时仅更新内容变化的文件")
+        options_layout.addWidget(self.clean_output_checkbox)
+        
+        self.frame_cache_checkbox = QCheckBox("帧缓存")
+        self.frame_cache_checkbox.setToolTip("将缩放后的帧缓存到视频旁的.npy文件，相同分辨率再次转换时无需重新解码")
+        options_layout.addWidget(self.frame_cache_checkbox)
+        self.row_dedup_checkbox = QCheckBox("行去重")
+        self.row_dedup_checkbox.setToolTip("内容相同的像素行共用一个函数（vd:rows/<hash>），减小数据包体积和/reload时间")
+        options_layout.addWidget(self.row_dedup_checkbox)
+        
+        encoder_layout = QHBoxLayout()
+        self.encoder_combo = QComboBox()
+        for encoder_class in ENCODERS.values():
+            self.encoder_combo.addItem(encoder_class.label, encoder_class.name)
+        encoder_layout.addWidget(self.encoder_combo)
+        self.block_palette_combo = QComboBox()
+        self.block_palette_combo.addItem("全部方块", "all")
+        self.block_palette_combo.addItem("混凝土", "concrete")
+        self.block_palette_combo.addItem("羊毛", "wool")
+        self.block_palette_combo.addItem("陶瓦", "terracotta")
+        self.block_palette_combo.setToolTip("方块墙/结构模板使用的调色板")
+        encoder_layout.addWidget(self.block_palette_combo)
+        options_form.addRow("渲染方式:", encoder_layout)
+        
+        self.fps_combo = QComboBox()
+        self.fps_combo.addItems(["20", "10", "5", "4", "2", "1"])
+        self.fps_combo.setToolTip("低帧率可减少文件数量、数据包体积和每tick开销，音频保持同步")
+        options_form.addRow("播放帧率 (FPS):", self.fps_combo)
+        
+        self.audio_segment_input = QLineEdit()
+        self.audio_segment_input.setPlaceholderText("例如: 10（留空则不分段）")
+        self.audio_segment_input.setValidator(QIntValidator(0, 600))
+        self.audio_segment_input.setToolTip("将音频切分为固定时长的片段，由对应的帧播放，定期与画面重新同步")
+        options_form.addRow("音频分段 (秒):", self.audio_segment_input)
+        
+        self.shard_size_input = QLineEdit()
+        self.shard_size_input.setPlaceholderText("例如: 1000（留空则所有帧函数放在同一目录）")
+        self.shard_size_input.setValidator(QIntValidator(0, 100000))
+        self.shard_size_input.setToolTip("每个子目录（vd:s000、vd:s001...）存放的帧函数数量，避免单个目录文件过多")
+        options_form.addRow("分片大小 (帧/目录):", self.shard_size_input)
+        
+        self.tile_size_input = QLineEdit()
+        self.tile_size_input.setPlaceholderText("例如: 64x36（留空则不分块）")
+        self.tile_size_input.setToolTip("将屏幕划分为多个分块，每个分块每帧生成一个函数，并行生成")
+        options_form.addRow("分块大小 (像素):", self.tile_size_input)
+        
+        self.lod_input = QLineEdit()
+        self.lod_input.setPlaceholderText("例如: 32,64,128（留空则不启用）")
+        self.lod_input.setToolTip("每个距离对应一个分辨率级别（逐级减半），范围内没有玩家时不输出粒子")
+        options_form.addRow("LOD距离 (方块):", self.lod_input)
+        
+        interlace_layout = QHBoxLayout()
+        self.interlace_input = QLineEdit()
+        self.interlace_input.setPlaceholderText("例如: 2（留空或1则不隔行）")
+        self.interlace_input.setValidator(QIntValidator(1, 16))
+        self.interlace_input.setToolTip("每个tick只输出1/N的行，每tick命令数减少为1/N")
+        interlace_layout.addWidget(self.interlace_input)
+        self.interlace_adaptive_checkbox = QCheckBox("场景切换时输出整帧")
+        interlace_layout.addWidget(self.interlace_adaptive_checkbox)
+        options_form.addRow("隔行渲染 (行数):", interlace_layout)
+        
+        palette_layout = QHBoxLayout()
+        self.palette_colors_input = QLineEdit()
+        self.palette_colors_input.setPlaceholderText("颜色数，例如: 32（留空则不量化）")
+        self.palette_colors_input.setValidator(QIntValidator(2, 256))
+        self.palette_colors_input.setToolTip("缩放后把画面量化为N种颜色，命令文本重复度更高，便于去重和压缩")
+        palette_layout.addWidget(self.palette_colors_input)
+        self.palette_mode_combo = QComboBox()
+        self.palette_mode_combo.addItem("按视频求调色板 (k-means)", "kmeans")
+        self.palette_mode_combo.addItem("固定调色板", "fixed")
+        palette_layout.addWidget(self.palette_mode_combo)
+        self.dither_checkbox = QCheckBox("有序抖动")
+        palette_layout.addWidget(self.dither_checkbox)
+        options_form.addRow("调色板量化:", palette_layout)
+        
+        crop_layout = QHBoxLayout()
+        self.auto_crop_checkbox = QCheckBox("自动裁剪黑边")
+        self.auto_crop_checkbox.setToolTip("转换前抽样检测视频中恒定的上下/左右黑边，只在有画面的区域生成粒子")
+        crop_layout.addWidget(self.auto_crop_checkbox)
+        self.crop_input = QLineEdit()
+        self.crop_input.setPlaceholderText("x,y,宽,高（填写后覆盖自动检测）")
+        self.crop_input.setToolTip("源视频像素坐标下的画面区域")
+        crop_layout.addWidget(self.crop_input)
+        self.detect_crop_btn = QPushButton("检测")
+        self.detect_crop_btn.setToolTip("检测黑边并填入裁剪区域，可再手动调整")
+        self.detect_crop_btn.clicked.connect(self.detect_crop)
+        crop_layout.addWidget(self.detect_crop_btn)
+        options_form.addRow("裁剪:", crop_layout)
+        
+        budget_layout = QHBoxLayout()
+        self.max_mb_input = QLineEdit()
+        self.max_mb_input.setPlaceholderText("大小上限 MB")
+        self.max_mb_input.setValidator(QIntValidator(1, 1000000))
+        budget_layout.addWidget(self.max_mb_input)
+        self.max_commands_input = QLineEdit()
+        self.max_commands_input.setPlaceholderText("每tick命令上限")
+        self.max_commands_input.setValidator(QIntValidator(1, 10000000))
+        budget_layout.addWidget(self.max_commands_input)
+        self.estimate_btn = QPushButton("预估输出")
+        self.estimate_btn.setToolTip("抽样编码少量帧，预估文件数、大小、每tick命令数和耗时")
+        self.estimate_btn.clicked.connect(lambda: self.run_preflight(False))
+        budget_layout.addWidget(self.estimate_btn)
+        self.autotune_btn = QPushButton("按预算调整")
+        self.autotune_btn.setToolTip("求解满足预算的最大分辨率，并相应放大粒子尺寸")
+        self.autotune_btn.clicked.connect(lambda: self.run_preflight(True))
+        budget_layout.addWidget(self.autotune_btn)
+        options_form.addRow("预算:", budget_layout)
+        
+        self.estimate_label = QLabel()
+        self.estimate_label.setWordWrap(True)
+        options_form.addRow("预估:", self.estimate_label)
+        
         # 进度条区
-        progress_group = QGroupBox("4. 转换进度")
+        progress_group = QGroupBox("5. 转换进度")
         progress_layout = QVBoxLayout(progress_group)
         progress_layout.setContentsMargins(15, 15, 15, 15)
         
@@ -1534,6 +4438,11 @@ class VideoConverterApp(QMainWindow):
         self.frame_progress_label.setAlignment(Qt.AlignCenter)
         progress_layout.addWidget(self.frame_progress_label)
         
+        # 吞吐量统计标签
+        self.metrics_label = QLabel()
+        self.metrics_label.setAlignment(Qt.AlignCenter)
+        progress_layout.addWidget(self.metrics_label)
+        
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(0)
@@ -1571,6 +4480,12 @@ class VideoConverterApp(QMainWindow):
         self.cancel_btn.clicked.connect(self.cancel_processing)
         buttons_layout.addWidget(self.cancel_btn)
         
+        self.simulate_btn = QPushButton("分析数据包")
+        self.simulate_btn.setFixedHeight(35)
+        self.simulate_btn.setToolTip("离线模拟已生成的数据包：统计每tick命令/粒子数，检查问题，并可把某一tick渲染为PNG")
+        self.simulate_btn.clicked.connect(self.simulate_datapack)
+        buttons_layout.addWidget(self.simulate_btn)
+        
         reset_btn = QPushButton("重置")
         reset_btn.setFixedHeight(35)
         reset_btn.clicked.connect(self.reset_form)
@@ -1580,6 +4495,7 @@ class VideoConverterApp(QMainWindow):
         layout.addWidget(video_group)
         layout.addWidget(dir_group)
         layout.addWidget(screen_group)
+        layout.addWidget(options_group)
         layout.addWidget(progress_group)
         layout.addLayout(buttons_layout)
         
@@ -1631,6 +4547,61 @@ class VideoConverterApp(QMainWindow):
             QMessageBox.warning(self, "数值错误", "请输入有效的数")
             return None
 
+    def collect_options(self):
+        """收集输出选项，输入无效时返回None"""
+        tile_size = None
+        tile_text = self.tile_size_input.text().strip()
+        if tile_text:
+            match = re.fullmatch(r"(\d+)\s*[xX×*]\s*(\d+)", tile_text)
+            if not match or int(match.group(1)) <= 0 or int(match.group(2)) <= 0:
+                QMessageBox.warning(self, "数值错误", "分块大小格式应为 宽x高，例如: 64x36")
+                return None
+            tile_size = (int(match.group(1)), int(match.group(2)))
+        
+        lod_distances = None
+        lod_text = self.lod_input.text().strip()
+        if lod_text:
+            try:
+                lod_distances = [int(part) for part in re.split(r"[,，\s]+", lod_text) if part]
+            except ValueError:
+                lod_distances = []
+            if not lod_distances or lod_distances != sorted(set(lod_distances)) or lod_distances[0] <= 0:
+                QMessageBox.warning(self, "数值错误", "LOD距离应为递增的正整数，例如: 32,64,128")
+                return None
+        
+        crop = "auto" if self.auto_crop_checkbox.isChecked() else None
+        crop_text = self.crop_input.text().strip()
+        if crop_text:
+            parts = re.split(r"[,，\s]+", crop_text)
+            if len(parts) != 4 or not all(part.isdigit() for part in parts) or \
+                    int(parts[2]) <= 0 or int(parts[3]) <= 0:
+                QMessageBox.warning(self, "数值错误", "裁剪区域格式应为 x,y,宽,高，例如: 0,140,1920,800")
+                return None
+            crop = tuple(int(part) for part in parts)
+        
+        return {
+            "encoder": self.encoder_combo.currentData(),
+            "block_palette": self.block_palette_combo.currentData(),
+            "compact": self.compact_checkbox.isChecked(),
+            "actionbar": self.actionbar_checkbox.isChecked(),
+            "force": self.force_checkbox.isChecked(),
+            "player": "scoreboard" if self.scoreboard_checkbox.isChecked() else "schedule",
+            "clean_output": self.clean_output_checkbox.isChecked(),
+            "frame_cache": self.frame_cache_checkbox.isChecked(),
+            "row_dedup": self.row_dedup_checkbox.isChecked(),
+            "tile_size": tile_size,
+            "lod_distances": lod_distances,
+            "fps": int(self.fps_combo.currentText()),
+            "audio_segment": int(self.audio_segment_input.text().strip() or 0),
+            "shard_size": int(self.shard_size_input.text().strip() or 0),
+            "interlace": int(self.interlace_input.text().strip() or 1),
+            "interlace_adaptive": self.interlace_adaptive_checkbox.isChecked(),
+            "crop": crop,
+            "palette_colors": int(self.palette_colors_input.text().strip() or 0),
+            "palette_mode": self.palette_mode_combo.currentData(),
+            "dither": self.dither_checkbox.isChecked()
+        }
+
     def check_ready(self):
         # 检查所有必要设置是否完成
         video_ok = self.video_path is not None
@@ -1681,6 +4652,9 @@ class VideoConverterApp(QMainWindow):
         screen_settings = self.validate_screen_settings()
         if not screen_settings:
             return
+        options = self.collect_options()
+        if options is None:
+            return
         
         # 显示音频状态标签
         self.audio_status_label.setVisible(True)
@@ -1708,6 +4682,8 @@ class VideoConverterApp(QMainWindow):
             self.cancel_btn.setVisible(True)
             self.status_label.setText("准备开始处理...")
             self.frame_progress_label.setText("")
+            self.metrics_label.setText("")
+            self.last_metrics = None
             
             # 创建并启动处理线程
             self.processing_thread = VideoProcessor(
@@ -1717,12 +4693,14 @@ class VideoConverterApp(QMainWindow):
                 screen_settings,
                 QApplication.instance(),
                 self.target_game_dir,
-                self.target_world_dir
+                self.target_world_dir,
+                options
             )
             
             # 连接信号
             self.processing_thread.progress_updated.connect(self.update_progress)
             self.processing_thread.processing_frame.connect(self.update_frame_progress)
+            self.processing_thread.metrics_updated.connect(self.update_metrics)
             self.processing_thread.finished_processing.connect(self.handle_processing_complete)
             
             # 启动计时器
@@ -1738,6 +4716,122 @@ class VideoConverterApp(QMainWindow):
             import traceback
             traceback.print_exc()
     
+    def run_preflight(self, autotune):
+        """预估输出规模；autotune为True时按预算求解分辨率并填入屏幕设置"""
+        if not self.video_path:
+            QMessageBox.warning(self, "信息不完整", "请先选择视频文件")
+            return
+        screen_settings = self.validate_screen_settings()
+        if not screen_settings:
+            return
+        options = self.collect_options()
+        if options is None:
+            return
+        max_mb = int(self.max_mb_input.text().strip() or 0)
+        max_commands = int(self.max_commands_input.text().strip() or 0)
+        if autotune and not (max_mb or max_commands):
+            QMessageBox.warning(self, "信息不完整", "请至少填写一项预算")
+            return
+        
+        self.estimate_label.setText("正在抽样预估...")
+        self.estimate_btn.setEnabled(False)
+        self.autotune_btn.setEnabled(False)
+        self.preflight_thread = PreflightWorker(self.video_path, options, screen_settings, autotune,
+                                                max_mb * 1024 * 1024, max_commands)
+        self.preflight_thread.estimate_ready.connect(self.handle_preflight_result)
+        self.preflight_thread.estimate_failed.connect(self.handle_preflight_failed)
+        self.preflight_thread.finished.connect(self.handle_preflight_finished)
+        self.preflight_thread.start()
+    
+    def handle_preflight_result(self, result):
+        """显示预估结果；按预算调整时把求得的分辨率和粒子尺寸填入屏幕设置"""
+        if not self.preflight_thread.autotune:
+            self.estimate_label.setText(PreflightEstimator.format_estimate(result))
+            return
+        if result is None:
+            self.estimate_label.setText("最小分辨率也无法满足预算，请放宽预算或更换编码器")
+            return
+        (width, height), _, particle_size = result[0]
+        self.width_input.setText(str(width))
+        self.height_input.setText(str(height))
+        self.particle_size_input.setText(str(min(400, round(particle_size * 100))))
+        self.estimate_label.setText("已按预算调整: " + PreflightEstimator.format_estimate(result[1]))
+    
+    def handle_preflight_failed(self, message):
+        self.estimate_label.setText(f"预估失败: {message}")
+    
+    def handle_preflight_finished(self):
+        """预估线程结束后恢复按钮（转换进行中时保持禁用）"""
+        converting = self.processing_thread is not None and self.processing_thread.isRunning()
+        self.estimate_btn.setEnabled(not converting)
+        self.autotune_btn.setEnabled(not converting)
+    
+    def detect_crop(self):
+        """抽样检测所选视频的黑边，并把结果填入裁剪区域"""
+        if not self.video_path:
+            QMessageBox.warning(self, "信息不完整", "请先选择视频文件")
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            crop = PreflightEstimator(self.video_path, {}).detect_crop()
+        except Exception as e:
+            QMessageBox.warning(self, "检测失败", f"无法检测黑边: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        if crop:
+            self.crop_input.setText(",".join(map(str, crop)))
+            self.update_status("检测到黑边，画面区域: {2}x{3}（偏移 {0},{1}）".format(*crop))
+        else:
+            self.crop_input.clear()
+            self.update_status("未检测到黑边")
+    
+    def simulate_datapack(self):
+        """选择数据包（目录中的pack.mcmeta或zip）并离线模拟播放"""
+        start_dir = os.path.join(self.target_world_dir, "datapacks") if self.target_world_dir else ""
+        path, _ = QFileDialog.getOpenFileName(self, "选择数据包的pack.mcmeta或zip文件", start_dir,
+                                              "数据包 (pack.mcmeta *.zip)")
+        if not path:
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            simulator = DatapackSimulator(path)
+            report = simulator.run()
+        except Exception as e:
+            QMessageBox.warning(self, "分析失败", f"无法分析数据包: {str(e)}")
+            traceback.print_exc()
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        reply = QMessageBox.question(
+            self, "数据包分析结果",
+            DatapackSimulator.format_report(report) + "\n\n是否将某一tick渲染为PNG？",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes or not report["ticks"]:
+            return
+        last_tick = report["ticks"][-1]["tick"]
+        tick, ok = QInputDialog.getInt(self, "渲染tick", f"tick (0-{last_tick}):",
+                                       report["peak_tick"] or 0, 0, last_tick)
+        if not ok:
+            return
+        distance = 0.0
+        if simulator.metadata.get("lod_distances"):
+            # 启用LOD时只渲染该距离的玩家看到的级别
+            distance, ok = QInputDialog.getDouble(self, "LOD级别", "玩家到原点的距离（方块）:", 0.0, 0.0, 1e6, 1)
+            if not ok:
+                return
+        output_path, _ = QFileDialog.getSaveFileName(self, "保存PNG", f"tick_{tick}.png", "PNG图片 (*.png)")
+        if not output_path:
+            return
+        try:
+            width, height = simulator.render_tick(tick, output_path, report, distance)
+            self.update_status(f"已渲染tick {tick}: {width}x{height} -> {output_path}")
+        except Exception as e:
+            QMessageBox.warning(self, "渲染失败", str(e))
+    
     def is_ffmpeg_available(self):
         """检查FFmpeg是否可用"""
         try:
@@ -1749,7 +4843,7 @@ class VideoConverterApp(QMainWindow):
                 startupinfo.wShowWindow = 0
                 
             process = subprocess.Popen(
-                [r'ffmpeg\ffmpeg.exe', '-version'],
+                [_ws_.resolve(r'ffmpeg\ffmpeg.exe'), '-version'],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 startupinfo=startupinfo
@@ -1799,6 +4893,11 @@ class VideoConverterApp(QMainWindow):
         if total_frames > 0:
             frame_percent = current_frame / total_frames * 100
             self.frame_progress_label.setText(f"帧处理进度: {current_frame}/{total_frames} ({frame_percent:.1f}%)")
+    
+    def update_metrics(self, metrics):
+        """更新吞吐量统计"""
+        self.last_metrics = metrics
+        self.metrics_label.setText(ThroughputMeter.format_metrics(metrics))
         
     def handle_processing_complete(self, success, message):
         """处理完成信号"""
@@ -1851,11 +4950,29 @@ class VideoConverterApp(QMainWindow):
         size = self.screen_size_input.text().strip()
         p_size = self.particle_size_input.text().strip()
         
+        player_help = ""
+        if self.scoreboard_checkbox.isChecked():
+            player_help = """<b>计分板播放器控制:</b><br>
+<code>/function 000init:pause</code> 暂停，<code>/function 000init:resume</code> 继续，
+<code>/function 000init:stop</code> 停止<br>
+<code>/function 000init:forward</code> / <code>/function 000init:rewind</code> 快进/快退10秒，
+<code>/scoreboard players set #frame vd_player &lt;帧&gt;</code> 跳转<br><br>
+"""
+        
+        metrics_info = ""
+        if self.last_metrics:
+            metrics = self.last_metrics
+            metrics_info = (
+                f"<b>转换统计:</b> {metrics['frames']}帧, 平均 {metrics['frames'] / max(metrics['elapsed'], 1e-6):.1f} 帧/秒, "
+                f"命令文件共 {metrics['bytes_written'] / (1024 * 1024):.2f} MB<br>"
+            )
+        
         return f"""
 <b>视频文件:</b> {os.path.basename(self.video_path)}<br>
 <b>屏幕参数:</b> 宽度={width}px, 高度={height}px, 尺寸={size}方块, 粒子大小={p_size}<br>
 <b>游戏目录:</b> {self.target_game_dir}<br>
-<b>世界目录:</b> {self.target_world_dir}<br><br>
+<b>世界目录:</b> {self.target_world_dir}<br>
+{metrics_info}<br>
 已创建:<br>
 • 资源包在 resourcepacks/video_music<br>
 • 数据包在世界目录的 datapacks/video_play<br><br>
@@ -1863,7 +4980,7 @@ class VideoConverterApp(QMainWindow):
 1. <code>/function 000init:init</code> - 初始化环境<br>
 2. <code>/function 000init:load</code> - 开始播放<br>
 3. <code>/function 000init:del</code> - 清除环境<br><br>
-"""
+{player_help}"""
     
     def cancel_processing(self):
         """取消正在进行的处理"""
@@ -1901,9 +5018,34 @@ class VideoConverterApp(QMainWindow):
         self.height_input.clear()
         self.screen_size_input.clear()
         self.particle_size_input.clear()
+        self.compact_checkbox.setChecked(False)
+        self.actionbar_checkbox.setChecked(True)
+        self.force_checkbox.setChecked(True)
+        self.scoreboard_checkbox.setChecked(False)
+        self.clean_output_checkbox.setChecked(False)
+        self.frame_cache_checkbox.setChecked(False)
+        self.row_dedup_checkbox.setChecked(False)
+        self.tile_size_input.clear()
+        self.lod_input.clear()
+        self.fps_combo.setCurrentIndex(0)
+        self.encoder_combo.setCurrentIndex(0)
+        self.block_palette_combo.setCurrentIndex(0)
+        self.audio_segment_input.clear()
+        self.shard_size_input.clear()
+        self.interlace_input.clear()
+        self.interlace_adaptive_checkbox.setChecked(False)
+        self.palette_colors_input.clear()
+        self.auto_crop_checkbox.setChecked(False)
+        self.crop_input.clear()
+        self.palette_mode_combo.setCurrentIndex(0)
+        self.dither_checkbox.setChecked(False)
+        self.max_mb_input.clear()
+        self.max_commands_input.clear()
+        self.estimate_label.setText("")
         self.progress_bar.setValue(0)
         self.status_label.setText("就绪")
         self.frame_progress_label.setText("")
+        self.metrics_label.setText("")
         self.audio_status_label.setVisible(False)
         
         # 重置按钮状态
@@ -1921,7 +5063,35 @@ class VideoConverterApp(QMainWindow):
         self.height_input.setEnabled(enabled)
         self.screen_size_input.setEnabled(enabled)
         self.particle_size_input.setEnabled(enabled)
+        self.compact_checkbox.setEnabled(enabled)
+        self.actionbar_checkbox.setEnabled(enabled)
+        self.force_checkbox.setEnabled(enabled)
+        self.scoreboard_checkbox.setEnabled(enabled)
+        self.clean_output_checkbox.setEnabled(enabled)
+        self.frame_cache_checkbox.setEnabled(enabled)
+        self.row_dedup_checkbox.setEnabled(enabled)
+        self.tile_size_input.setEnabled(enabled)
+        self.lod_input.setEnabled(enabled)
+        self.fps_combo.setEnabled(enabled)
+        self.encoder_combo.setEnabled(enabled)
+        self.block_palette_combo.setEnabled(enabled)
+        self.audio_segment_input.setEnabled(enabled)
+        self.shard_size_input.setEnabled(enabled)
+        self.interlace_input.setEnabled(enabled)
+        self.interlace_adaptive_checkbox.setEnabled(enabled)
+        self.palette_colors_input.setEnabled(enabled)
+        self.auto_crop_checkbox.setEnabled(enabled)
+        self.crop_input.setEnabled(enabled)
+        self.detect_crop_btn.setEnabled(enabled)
+        self.palette_mode_combo.setEnabled(enabled)
+        self.dither_checkbox.setEnabled(enabled)
+        self.max_mb_input.setEnabled(enabled)
+        self.max_commands_input.setEnabled(enabled)
+        preflight_idle = not (self.preflight_thread and self.preflight_thread.isRunning())
+        self.estimate_btn.setEnabled(enabled and preflight_idle)
+        self.autotune_btn.setEnabled(enabled and preflight_idle)
         self.convert_btn.setEnabled(enabled)
+        self.simulate_btn.setEnabled(enabled)
         
         alpha = 1.0 if enabled else 0.6
         self.drop_area.setStyleSheet(f"background-color: rgba(240, 240, 240, {alpha})")
@@ -1943,6 +5113,9 @@ class VideoConverterApp(QMainWindow):
                 event.ignore()
         else:
             event.accept()
+        # 预估无法中途取消，等待其结束（通常只需数秒）
+        if event.isAccepted() and self.preflight_thread and self.preflight_thread.isRunning():
+            self.preflight_thread.wait()
 
 
 class DropArea(QLabel):